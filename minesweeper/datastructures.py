@@ -1,29 +1,96 @@
+import heapq
+import math
 from collections import defaultdict
 from typing import (
     Callable,
     Dict,
+    FrozenSet,
     Generic,
     Iterable,
+    Iterator,
+    List,
     NewType,
     Set,
     Tuple,
+    Type,
     TypeVar,
 )
 
 from .director.base import Cell
+from .util import iter_bits
 
 
 Coord = NewType('Coord', Tuple[int, int])
 
+T = TypeVar('T')
 Obj = TypeVar('Obj')
 Prop = TypeVar('Prop')
 
 
+class DisjointSet(Generic[T]):
+    """Union-find over hashable items, tracking the members of each set"""
+
+    def __init__(self, items: Iterable[T]=()):
+        self._parent: Dict[T, T] = {}
+        self._members: Dict[T, Set[T]] = {}
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item: T):
+        return item in self._parent
+
+    def add(self, item: T):
+        """Add item as its own set, if it isn't already in one"""
+        if item not in self._parent:
+            self._parent[item] = item
+            self._members[item] = {item}
+
+    def find(self, item: T) -> T:
+        """Return the representative of item's set"""
+        parent = self._parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    def union(self, a: T, b: T) -> T:
+        """Merge the sets of a and b, returning the new representative"""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return root_a
+
+        if len(self._members[root_a]) < len(self._members[root_b]):
+            root_a, root_b = root_b, root_a
+
+        self._parent[root_b] = root_a
+        self._members[root_a] |= self._members.pop(root_b)
+        return root_a
+
+    def members(self, item: T) -> Set[T]:
+        return self._members[self.find(item)]
+
+    def remove_set(self, item: T) -> Set[T]:
+        """Remove the whole set containing item, returning its members"""
+        members = self._members.pop(self.find(item))
+        for member in members:
+            del self._parent[member]
+        return members
+
+    def groups(self) -> Iterable[Set[T]]:
+        return self._members.values()
+
+
 class PropertyGraph(Generic[Obj, Prop]):
     def __init__(self, objects: Iterable[Obj]=None, get_props: Callable[[Obj], Iterable[Prop]]=None):
         self._get_props = get_props or (lambda o: ())
         self._props: Dict[Obj, Set[Prop]] = defaultdict(set)
         self._reverse: Dict[Prop, Set[Obj]] = defaultdict(set)
+
+        # Connected components are maintained lazily: objects whose relations
+        # changed are noted, and only they are re-linked on the next query.
+        self._components: DisjointSet[Obj] = DisjointSet()
+        self._unlinked: Set[Obj] = set()
+
         self.update(objects or ())
 
     def update(self, objects: Iterable[Obj]):
@@ -39,11 +106,62 @@ class PropertyGraph(Generic[Obj, Prop]):
         self._props[o].update(props)
         for prop in props:
             self._reverse[prop].add(o)
+        self._unlinked.add(o)
 
     def remove(self, o: Obj):
+        self._split_component(o)
+        self._unlinked.discard(o)
         for prop in self.props_of(o):
             self._reverse[prop].discard(o)
-        del self._props[o]
+        self._props.pop(o, None)
+
+    def add_prop(self, o: Obj, prop: Prop):
+        """Relate a single extra prop to an object"""
+        self._props[o].add(prop)
+        self._reverse[prop].add(o)
+        self._unlinked.add(o)
+
+    def remove_prop(self, prop: Prop):
+        """Strip a prop from all objects, dropping objects left with no props"""
+        for o in self.objects_containing(prop):
+            self._split_component(o)
+
+        for o in self._reverse.pop(prop, ()):
+            props = self._props[o]
+            props.discard(prop)
+            if not props:
+                del self._props[o]
+
+    def _split_component(self, o: Obj):
+        """Dissolve the component of an object whose relations are shrinking
+
+        Its members are re-linked on the next query, splitting the component if
+        the object was its only bridge.
+        """
+        if o in self._components:
+            self._unlinked |= self._components.remove_set(o)
+
+    def _link_components(self):
+        unlinked = [o for o in self._unlinked if o in self]
+        self._unlinked = set()
+
+        for o in unlinked:
+            self._components.add(o)
+        for o in unlinked:
+            for relative in self.relatives_of(o):
+                self._components.union(o, relative)
+
+    def components(self) -> List[FrozenSet[Obj]]:
+        """All groups of objects connected through shared props"""
+        self._link_components()
+        return [frozenset(members) for members in self._components.groups()]
+
+    def component_of(self, o: Obj) -> FrozenSet[Obj]:
+        """All objects connected to o through shared props, including o"""
+        self._link_components()
+        if o not in self._components:
+            return frozenset()
+        return frozenset(self._components.members(o))
 
     def __iter__(self):
         return iter(self._props)
@@ -52,24 +170,19 @@ class PropertyGraph(Generic[Obj, Prop]):
         return set(self._reverse)
 
     def props_of(self, o: Obj) -> Set[Prop]:
-        return self._props[o]
+        return self._props.get(o) or set()
 
     def objects_containing(self, prop: Prop) -> Set[Obj]:
-        return self._reverse[prop]
+        return self._reverse.get(prop) or set()
 
     def get_independent_objects(self) -> Set[Obj]:
         """All objects which share no props with any others"""
-        objects = set(self._props)
-        independent = set(objects)
-
-        for object in objects:
-            relatives = self.relatives_of(object)
-
-            if relatives:
-                independent -= relatives
-                independent.discard(object)
-
-        return independent
+        return {
+            o
+            for component in self.components()
+            if len(component) == 1
+            for o in component
+        }
 
     def __contains__(self, o: Obj):
         return o in self._props
@@ -107,6 +220,195 @@ class PropertyGraph(Generic[Obj, Prop]):
             our_props == their_props
         ))
 
+    def objects_contained_by(self, props: Iterable[Prop], ignore: Iterable[Prop]=()
+                             ) -> Set[Obj]:
+        """Objects sharing any of props, whose other props (less ignore) are all among props
+
+        This answers relatives_contained_by() for a hypothetical object, without
+        having to build a new graph including it.
+        """
+        props = set(props)
+        ignore = set(ignore)
+
+        candidates = set()
+        for prop in props - ignore:
+            candidates |= self.objects_containing(prop)
+
+        return {
+            candidate
+            for candidate in candidates
+            if (self.props_of(candidate) - ignore).issubset(props)
+        }
+
+
+class BitsetPropertyGraph(PropertyGraph[Obj, Prop]):
+    """A PropertyGraph storing each object's props as an integer bitmask
+
+    Props are assigned dense bit positions as they're first seen, and an
+    inverted index maps each bit to the objects having it. Containment queries
+    are then bitwise ANDs and compares, rather than set operations.
+
+    Any PropertyGraph subclass may be given this backend with with_bitsets().
+    """
+
+    def __init__(self, objects: Iterable[Obj]=None, get_props: Callable[[Obj], Iterable[Prop]]=None):
+        self._masks: Dict[Obj, int] = {}
+        self._bit_of: Dict[Prop, int] = {}
+        self._prop_of: List[Prop] = []
+        self._free_bits: List[int] = []
+        super().__init__(objects, get_props)
+
+        # Unused by this backend
+        del self._props
+
+    def _get_bit(self, prop: Prop) -> int:
+        bit = self._bit_of.get(prop)
+        if bit is None:
+            if self._free_bits:
+                bit = self._free_bits.pop()
+                self._prop_of[bit] = prop
+            else:
+                bit = len(self._prop_of)
+                self._prop_of.append(prop)
+            self._bit_of[prop] = bit
+        return bit
+
+    def mask_of(self, props: Iterable[Prop]) -> int:
+        """Bitmask of the passed props, ignoring any never seen by the graph"""
+        mask = 0
+        for prop in props:
+            bit = self._bit_of.get(prop)
+            if bit is not None:
+                mask |= 1 << bit
+        return mask
+
+    def add(self, o: Obj, extra_props: Iterable[Prop]=None):
+        props = tuple(self._get_props(o)) + tuple(extra_props or ())
+        mask = self._masks.get(o, 0)
+        for prop in props:
+            bit = self._get_bit(prop)
+            mask |= 1 << bit
+            self._reverse[bit].add(o)
+        self._masks[o] = mask
+        self._unlinked.add(o)
+
+    def remove(self, o: Obj):
+        self._split_component(o)
+        self._unlinked.discard(o)
+        for bit in iter_bits(self._masks.pop(o, 0)):
+            self._reverse[bit].discard(o)
+
+    def add_prop(self, o: Obj, prop: Prop):
+        bit = self._get_bit(prop)
+        self._masks[o] = self._masks.get(o, 0) | (1 << bit)
+        self._reverse[bit].add(o)
+        self._unlinked.add(o)
+
+    def remove_prop(self, prop: Prop):
+        bit = self._bit_of.pop(prop, None)
+        if bit is None:
+            return
+
+        for o in self._reverse.get(bit, ()):
+            self._split_component(o)
+
+        unset = ~(1 << bit)
+        for o in self._reverse.pop(bit, ()):
+            mask = self._masks[o] & unset
+            if mask:
+                self._masks[o] = mask
+            else:
+                del self._masks[o]
+
+        self._prop_of[bit] = None
+        self._free_bits.append(bit)
+
+    def __iter__(self):
+        return iter(self._masks)
+
+    def __contains__(self, o: Obj):
+        return o in self._masks
+
+    def all_props(self) -> Set[Prop]:
+        return set(self._bit_of)
+
+    def props_of(self, o: Obj) -> Set[Prop]:
+        return {self._prop_of[bit] for bit in iter_bits(self._masks.get(o, 0))}
+
+    def objects_containing(self, prop: Prop) -> Set[Obj]:
+        bit = self._bit_of.get(prop)
+        return (self._reverse.get(bit) if bit is not None else None) or set()
+
+    def _relatives_of_mask(self, mask: int) -> Set[Obj]:
+        relatives = set()
+        for bit in iter_bits(mask):
+            relatives |= self._reverse[bit]
+        return relatives
+
+    def relatives_of(self, o: Obj) -> Set[Obj]:
+        relatives = self._relatives_of_mask(self._masks.get(o, 0))
+        relatives.discard(o)
+        return relatives
+
+    def relatives_contained_by(self, o: Obj, strict: bool=False) -> Set[Obj]:
+        ours = self._masks.get(o, 0)
+        masks = self._masks
+        return {
+            relative
+            for relative in self.relatives_of(o)
+            if not masks[relative] & ~ours and not (strict and masks[relative] == ours)
+        }
+
+    def relatives_containing(self, o: Obj, strict: bool=False) -> Set[Obj]:
+        ours = self._masks.get(o, 0)
+        masks = self._masks
+        return {
+            relative
+            for relative in self.relatives_of(o)
+            if not ours & ~masks[relative] and not (strict and masks[relative] == ours)
+        }
+
+    def relatives_equal_to(self, o: Obj) -> Set[Obj]:
+        ours = self._masks.get(o, 0)
+        return {relative for relative in self.relatives_of(o)
+                if self._masks[relative] == ours}
+
+    def objects_contained_by(self, props: Iterable[Prop], ignore: Iterable[Prop]=()
+                             ) -> Set[Obj]:
+        # Props unknown to the graph can't be shared by any object
+        ours = self.mask_of(props)
+        ignored = self.mask_of(ignore)
+
+        masks = self._masks
+        return {
+            candidate
+            for candidate in self._relatives_of_mask(ours & ~ignored)
+            if not masks[candidate] & ~ignored & ~ours
+        }
+
+
+_bitset_graph_classes: Dict[type, type] = {}
+
+
+def with_bitsets(graph_cls: Type[PropertyGraph]) -> Type[PropertyGraph]:
+    """Return a version of a PropertyGraph subclass using the bitset backend
+
+    Usage:
+
+        graph = with_bitsets(CellGraph)(cells, get_neighbors)
+
+    """
+    if issubclass(graph_cls, BitsetPropertyGraph):
+        return graph_cls
+    if graph_cls is PropertyGraph:
+        return BitsetPropertyGraph
+
+    bitset_cls = _bitset_graph_classes.get(graph_cls)
+    if bitset_cls is None:
+        bitset_cls = _bitset_graph_classes[graph_cls] = type(
+            f'Bitset{graph_cls.__name__}', (graph_cls, BitsetPropertyGraph), {})
+    return bitset_cls
+
 
 def graph_by(objects: Iterable[Obj],
              get_props: Callable[[Obj], Iterable[Prop]]
@@ -126,3 +428,145 @@ class CellGraph(PropertyGraph[Cell, Coord]):
     def __init__(self, cells: Iterable[Cell]=None, get_neighbors: Callable[[Cell], Iterable[Cell]]=None):
         get_neighbors = get_neighbors or (lambda c: c.get_neighbors())
         super().__init__(cells, get_neighbors)
+
+
+class FrontierGraph(CellGraph):
+    """Relate numbered cells by their shared unrevealed neighbours, across steps
+
+    Cells change type (and, thus, hash) as the game progresses, so unrevealed
+    neighbours are tracked by their coords. Instead of rebuilding the graph
+    each step, feed it the cells which changed since the last one.
+
+    Usage:
+
+        graph = FrontierGraph(numbered_cells)
+        ...
+        graph.refresh(control.get_dirty_cells())
+
+    """
+
+    def __init__(self, cells: Iterable[Cell]=None):
+        super().__init__(cells, self.get_unrevealed_coords)
+
+    @staticmethod
+    def get_unrevealed_coords(cell: Cell) -> Iterable[Coord]:
+        return ((neighbor.x, neighbor.y)
+                for neighbor in cell.get_unrevealed_neighbors())
+
+    def add(self, o: Cell, extra_props: Iterable[Coord]=None):
+        super().add(o, extra_props)
+        if not self.props_of(o):
+            # Numbers without unrevealed neighbours don't belong to the frontier
+            self.remove(o)
+
+    def refresh(self, dirty_cells: Iterable[Cell]):
+        """Update relations using the cells which changed since last refresh"""
+        for cell in dirty_cells:
+            coord = cell.x, cell.y
+
+            if cell.is_unrevealed():
+                # This happens when a flag is removed
+                for neighbor in cell.get_neighbors(is_number=True):
+                    if neighbor in self:
+                        self.add_prop(neighbor, coord)
+                    else:
+                        self.add(neighbor)
+            else:
+                self.remove_prop(coord)
+
+            if cell.is_number() and cell not in self:
+                self.add(cell)
+
+
+class GridIndex:
+    """Bucket cells by square regions of the board, to answer locality queries
+
+    Cells are stored by idx, as their hashes change with their type.
+
+    Usage:
+
+        index = GridIndex(width, height, cells)
+        closest = next(index.nearest(x, y))
+
+    """
+
+    def __init__(self, width: int, height: int, cells: Iterable[Cell]=(),
+                 bucket_size: int=8):
+        self.width = width
+        self.height = height
+        self.bucket_size = bucket_size
+
+        self._num_cols = (width + bucket_size - 1) // bucket_size
+        self._num_rows = (height + bucket_size - 1) // bucket_size
+        self._buckets: Dict[Tuple[int, int], Dict[int, Cell]] = defaultdict(dict)
+        self._bucket_of: Dict[int, Tuple[int, int]] = {}
+
+        for cell in cells:
+            self.add(cell)
+
+    def _get_bucket_key(self, x, y) -> Tuple[int, int]:
+        return x // self.bucket_size, y // self.bucket_size
+
+    def add(self, cell: Cell):
+        key = self._get_bucket_key(cell.x, cell.y)
+        self._buckets[key][cell.idx] = cell
+        self._bucket_of[cell.idx] = key
+
+    def discard(self, cell: Cell):
+        key = self._bucket_of.pop(cell.idx, None)
+        if key is not None:
+            del self._buckets[key][cell.idx]
+
+    def __contains__(self, cell: Cell):
+        return cell.idx in self._bucket_of
+
+    def __len__(self):
+        return len(self._bucket_of)
+
+    def __iter__(self) -> Iterator[Cell]:
+        for bucket in self._buckets.values():
+            yield from bucket.values()
+
+    def _iter_ring(self, col, row, radius) -> Iterator[Tuple[int, int]]:
+        """Yield keys of buckets at exactly radius buckets from (col, row)"""
+        if radius == 0:
+            yield col, row
+            return
+
+        for c in range(col - radius, col + radius + 1):
+            for r in (row - radius, row + radius):
+                if 0 <= c < self._num_cols and 0 <= r < self._num_rows:
+                    yield c, r
+        for r in range(row - radius + 1, row + radius):
+            for c in (col - radius, col + radius):
+                if 0 <= c < self._num_cols and 0 <= r < self._num_rows:
+                    yield c, r
+
+    def nearest(self, x: float, y: float) -> Iterator[Cell]:
+        """Lazily yield cells in ascending distance from the point x, y
+
+        Points off the board are clamped to it, and undefined coords (inf, nan)
+        are treated as 0. Only the regions needed to produce each cell are
+        visited, so taking the first k cells costs O(k), not O(board).
+        """
+        x = min(max(x, 0), self.width - 1) if math.isfinite(x) else 0
+        y = min(max(y, 0), self.height - 1) if math.isfinite(y) else 0
+        col, row = self._get_bucket_key(int(x), int(y))
+
+        max_radius = max(col, self._num_cols - 1 - col,
+                         row, self._num_rows - 1 - row)
+
+        heap = []
+        for radius in range(max_radius + 1):
+            for key in self._iter_ring(col, row, radius):
+                for idx, cell in self._buckets.get(key, {}).items():
+                    dist = (cell.x - x)**2 + (cell.y - y)**2
+                    heapq.heappush(heap, (dist, idx, cell))
+
+            # Every cell in further rings lies beyond this distance
+            bound = (radius * self.bucket_size)**2
+            while heap and heap[0][0] <= bound:
+                yield heapq.heappop(heap)[2]
+
+        while heap:
+            yield heapq.heappop(heap)[2]
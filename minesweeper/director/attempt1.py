@@ -12,13 +12,18 @@ import logging
 import math
 import operator
 from functools import reduce
+from itertools import islice
 
 from random import SystemRandom
-from typing import List, Set
+from typing import Iterator, Set, Tuple
 
-from minesweeper.datastructures import CellGraph
-from minesweeper.director.base import Cell, register_director
+from minesweeper.datastructures import FrontierGraph, GridIndex, with_bitsets
+from minesweeper.director.base import Cell, Deadline, register_director
 from minesweeper.director.random_director import RandomExpansionDirector
+from minesweeper.linalg import find_forced
+from minesweeper.patterns import get_pattern_table, windows_touching
+from minesweeper.raytrace import int_trace_length
+from minesweeper.util import iter_bits
 
 random = SystemRandom()
 
@@ -33,22 +38,46 @@ class AttemptUnoDirector(RandomExpansionDirector):
         self.disable_low_confidence = kwargs.pop('disable_low_confidence',
                                                  False)
 
+        # Whether to gather every confident plan and choose the most visually
+        # appealing one, rather than stopping at the first few found.
+        self.choose_appealing_plans = kwargs.pop('choose_appealing_plans',
+                                                 False)
+        # Number of confident plans to gather before choosing among them
+        self.max_confident_candidates = kwargs.pop('max_confident_candidates',
+                                                   3)
+
         super(AttemptUnoDirector, self).__init__(*args, **kwargs)
 
-        # Cached state for each step
-        self._cells: List[Cell] = None
-        self._numbered: List[Cell] = None
-        self._revealed: List[Cell] = None
+        # Board state, maintained between steps from the dirty-cell feed
+        self._numbered: GridIndex = None
+        self._unrevealed: GridIndex = None
+        self._revealed: Set[int] = None
+        self._graph: FrontierGraph = None
         self.history = None
 
-    def sort_by_last_move(self, cells):
-        """Sort cells based on location near the last moves"""
-        return sorted(cells, key=lambda c: self.avg_dist_to_last_moves(c.x, c.y, num_moves=3))
+        # Numbered cells whose windows may match a known local pattern
+        self._pattern_candidates: GridIndex = None
+
+        # Time by which the current step must settle on its moves
+        self._deadline: Deadline = Deadline()
+
+        # Projected location of the next move, which cells are ordered around
+        self._focus: Tuple[float, float] = None
+
+    def reset(self):
+        self._numbered = None
+        self._unrevealed = None
+        self._revealed = None
+        self._graph = None
+        self._pattern_candidates = None
+
+    def numbered_cells(self) -> Iterator[Cell]:
+        """Numbered cells, nearest the projected next move first"""
+        return self._numbered.nearest(*self._focus)
 
-    def sort_by_momentum_bias(self, cells):
-        """Sort cells based on projected next location using average velocity"""
-        next_x, next_y = self.projected_move_location(num_moves=3)
-        return sorted(cells, key=lambda c: self.dist_between_cell_and_point(c, next_x, next_y))
+    def unrevealed_cells(self) -> Iterator[Cell]:
+        """Unrevealed cells, nearest the projected next move first"""
+        return self._unrevealed.nearest(*self._focus)
 
     def dist_to_last_move(self, x, y):
         return next(self.dist_to_last_moves(x, y, num_moves=1))
@@ -60,10 +89,6 @@ class AttemptUnoDirector(RandomExpansionDirector):
         else:
             yield float('Inf')
 
-    def avg_dist_to_last_moves(self, x, y, num_moves):
-        dist_to_last_moves = tuple(self.dist_to_last_moves(x, y, num_moves=num_moves))
-        return sum(dist_to_last_moves) / len(dist_to_last_moves)
-
     def dist_between_last_moves(self, num_moves):
         if self.history[-2:-1]:
             _, (last_x, last_y) = self.history[-1]
@@ -135,36 +160,84 @@ class AttemptUnoDirector(RandomExpansionDirector):
                 best_cell = cell
         return best_cell, lowest_dist
 
+    def plan_priority(self, plan):
+        """Cheap score of a plan, lower being better
+
+        This is the length of the shortest ray between the last move and any
+        cell of the plan.
+        """
+        if not self.history:
+            return 0
+
+        _, (last_x, last_y) = self.history[-1]
+        return min(int_trace_length(cell.x, cell.y, last_x, last_y)
+                   for _, cell in plan)
+
+    def iter_plans(self, planners, deadline: Deadline = None, unbounded=()):
+        """Lazily yield (planner, plan) from each planner in turn
+
+        If a deadline is passed, no further planners are started once it's past,
+        except those in unbounded.
+        """
+        for planner in planners:
+            if planner not in unbounded and deadline is not None and deadline.expired():
+                logger.info('Out of time before planning with %s', planner.__name__)
+                continue
+
+            for plan in planner() or ():
+                if plan:
+                    yield planner, plan
+
     def get_next_moves(self):
         # Each planners should return an iterable (or generator) of plans, which
         # are lists of ('action', cell)
+        #
+        # Planners of tiers bounded by the deadline are skipped once it's past,
+        # so the plans found so far (or a cheap guess) are acted on instead.
+        # The cheapest certain planners, and the cardinal guess, always run:
+        # running out of time should never leave us guessing worse than them.
+        unbounded = (
+            self.first_click,
+            self.endgame_obvious,
+            self.obvious,
+        )
         planner_tiers = (
-            ('confident', True, (
+            # Cheapest planners come first, so lazy evaluation can stop early
+            ('confident', True, True, (
+                self.first_click,
+                self.endgame_obvious,
                 self.obvious,
+                self.known_patterns,
                 self.immediate_grouping,
                 self.indirect_grouping,
-                self.first_click,
-                self.endgame_obvious,
+                self.linear_deduction,
                 self.endgame_insight,
             )),
-            ('heuristic guess', False, (
+            ('heuristic guess', False, False, (
                 self.expand_cardinally,
             )),
-            ('total guess', False, (
+            ('total guess', False, False, (
                 self.expand_randomly,
             )),
-            ('last resort', False, (
+            ('last resort', False, False, (
                 self.choose_randomly,
             )),
         )
 
-        for planner_type, is_confident, planners in planner_tiers:
-            plans = [
-                (planner, plan)
-                for planner in planners
-                for plan in planner() or ()
-                if plan
-            ]
+        for planner_type, is_confident, is_bounded, planners in planner_tiers:
+            deadline = self._deadline if is_bounded else None
+
+            if is_confident and not self.choose_appealing_plans:
+                plans = list(islice(self.iter_plans(planners, deadline, unbounded),
+                                    self.max_confident_candidates))
+                if plans:
+                    planner, plan = min(plans, key=lambda t: self.plan_priority(t[1]))
+                    logger.info('Chose %s plan of %s (first %d found): %r',
+                                planner_type, planner.__name__, len(plans), plan)
+                    return plan
+                continue
+
+            plans = list(self.iter_plans(planners, deadline, unbounded))
 
             # Only choose visually appealing plans if all are equally as probable
             # (This seems like it could be generalized to all confidence levels,
@@ -180,7 +253,8 @@ class AttemptUnoDirector(RandomExpansionDirector):
                             if cell in revealed_between:
                                 continue
 
-                            num_revealed_trace = len(tuple(cell.trace_to(last_cell)))
+                            num_revealed_trace = int_trace_length(cell.x, cell.y,
+                                                                  last_cell.x, last_cell.y)
                             revealed_between[cell] = (num_revealed_trace, planner, plan)
 
                     if revealed_between:
@@ -212,17 +286,48 @@ class AttemptUnoDirector(RandomExpansionDirector):
                             planner_type, random_planner, random_plan)
                 return random_plan
 
-    def act(self):
-        # Sorting makes the director more visually appealing by having most
-        # moves seem near each other.
-        self._cells = self.sort_by_momentum_bias(self.control.get_cells())
-        self._numbered = [c for c in self._cells if c.is_number()]
-        self._revealed = [c for c in self._cells if c.is_revealed()]
+    def refresh_state(self):
+        """Bring cached board state up-to-date with the cells changed since last step"""
+        if self._graph is None:
+            width, height = self.control.get_board_size()
+            cells = self.control.get_cells()
+
+            self._numbered = GridIndex(width, height, (c for c in cells if c.is_number()))
+            self._unrevealed = GridIndex(width, height, (c for c in cells if c.is_unrevealed()))
+            self._revealed = {c.idx for c in cells if c.is_revealed()}
+            self._graph = with_bitsets(FrontierGraph)(self._numbered)
+            self._pattern_candidates = GridIndex(width, height, self._numbered)
+            return
+
+        dirty_cells = self.control.get_dirty_cells()
+        self._graph.refresh(dirty_cells)
+        for cell in windows_touching(dirty_cells):
+            self._pattern_candidates.add(cell)
+
+        for cell in dirty_cells:
+            self._numbered.discard(cell)
+            self._unrevealed.discard(cell)
+            self._revealed.discard(cell.idx)
+
+            if cell.is_number():
+                self._numbered.add(cell)
+            if cell.is_unrevealed():
+                self._unrevealed.add(cell)
+            if cell.is_revealed():
+                self._revealed.add(cell.idx)
+
+    def act(self, deadline: Deadline = None):
+        self._deadline = deadline or Deadline()
 
         history = self.control.get_history()
         if history:
             self.history = history
 
+        # Ordering cells around the projected next move makes the director more
+        # visually appealing by having most moves seem near each other.
+        self._focus = self.projected_move_location(num_moves=3)
+        self.refresh_state()
+
         moves = self.get_next_moves()
         if moves:
             logger.info('Executing moves: %r', moves)
@@ -251,8 +356,8 @@ class AttemptUnoDirector(RandomExpansionDirector):
                             ^ ^
 
         """
-        for cell in self._numbered:
-            unrevealed = cell.get_neighbors(is_unrevealed=True)
+        for cell in self.numbered_cells():
+            unrevealed = cell.get_unrevealed_neighbors()
             if not unrevealed:
                 # Ehhh, who needs you!
                 continue
@@ -268,6 +373,22 @@ class AttemptUnoDirector(RandomExpansionDirector):
             if unrevealed and not num_flags_left:
                 yield [('middle_click', cell)]
 
+    def known_patterns(self):
+        """Deductions looked up in the table of precomputed local patterns
+
+        Only windows which have changed since they were last looked up are
+        looked up again, nearest the projected next move first.
+        """
+        table = get_pattern_table()
+        for cell in self._pattern_candidates.nearest(*self._focus):
+            found = table.lookup_cell(cell)
+            if not found:
+                self._pattern_candidates.discard(cell)
+                continue
+
+            safe, mines = found
+            yield [('click', c) for c in safe] + [('right_click', c) for c in mines]
+
     def immediate_grouping(self):
         """Deductive reasoning using info from direct relatives
 
@@ -280,22 +401,15 @@ class AttemptUnoDirector(RandomExpansionDirector):
                                 ^
 
         """
-        graph = CellGraph(self._numbered,
-                         lambda c: c.get_neighbors(is_unrevealed=True))
-
         # Deductive reasoning through grouping
-        for cell in self._numbered:
-            neighbors = cell.get_neighbors()
-            numbered_neighbors = graph.relatives_of(cell)
+        for cell in self.numbered_cells():
+            numbered_neighbors = self._graph.relatives_of(cell)
 
-            flagged = [c for c in neighbors if c.is_flagged()]
-            unrevealed = {c for c in neighbors if c.is_unrevealed()}
-            necessary = cell.number - len(flagged)
+            unrevealed = cell.get_unrevealed_neighbors()
+            necessary = cell.num_flags_left
 
             for neighbor in numbered_neighbors:
-                neighbor_neighbors = neighbor.get_neighbors()
-                neighbor_unrevealed = {c for c in neighbor_neighbors
-                                       if c.is_unrevealed()}
+                neighbor_unrevealed = neighbor.get_unrevealed_neighbors()
                 if (unrevealed.issubset(neighbor_unrevealed) and
                         unrevealed != neighbor_unrevealed):
                     neighbor_num_flags_left = neighbor.num_flags_left
@@ -320,24 +434,24 @@ class AttemptUnoDirector(RandomExpansionDirector):
                               ^
 
         """
-        unrevealed_graph = CellGraph(self._numbered, lambda c: c.get_neighbors(is_unrevealed=True))
+        unrevealed_graph = self._graph
 
-        for cell in self._numbered:
+        for cell in self.numbered_cells():
             cell_needs = cell.num_flags_left
             if not cell_needs:
                 continue
 
-            cell_unrevealed = cell.get_neighbors(is_unrevealed=True)
+            cell_unrevealed = cell.get_unrevealed_neighbors()
 
             neighbors = unrevealed_graph.relatives_containing(cell)
             for neighbor in neighbors:
                 neighbor_needs = neighbor.num_flags_left
-                neighbor_unrevealed = neighbor.get_neighbors(is_unrevealed=True)
+                neighbor_unrevealed = neighbor.get_unrevealed_neighbors()
 
                 insightful_neighbors = unrevealed_graph.relatives_contained_by(neighbor, strict=True)
                 for insightful_neighbor in insightful_neighbors:
                     insightful_neighbor_needs = insightful_neighbor.num_flags_left
-                    insightful_neighbor_unrevealed = insightful_neighbor.get_neighbors(is_unrevealed=True)
+                    insightful_neighbor_unrevealed = insightful_neighbor.get_unrevealed_neighbors()
 
                     if cell_unrevealed.intersection(insightful_neighbor_unrevealed):
                         # If the insightful neighbour shares any of the same
@@ -375,6 +489,45 @@ class AttemptUnoDirector(RandomExpansionDirector):
                         ]
                         yield plan + debug
 
+    def linear_deduction(self):
+        """Deductive reasoning using every number along a frontier at once
+
+        Each number is an equation over its unrevealed neighbours. Row-reducing
+        all the equations of a connected frontier finds forced cells which no
+        pair (or trio) of groups reveals alone.
+        """
+        seen = set()
+        for cell in self.numbered_cells():
+            if self._deadline.expired():
+                return
+            if cell in seen:
+                continue
+
+            component = self._graph.component_of(cell)
+            seen.update(component)
+            if not component:
+                continue
+
+            unrevealed = sorted({c for numbered in component
+                                 for c in numbered.get_unrevealed_neighbors()},
+                                key=lambda c: c.idx)
+            bits = {c: 1 << i for i, c in enumerate(unrevealed)}
+            constraints = [
+                (reduce(operator.or_, map(bits.get, numbered.get_unrevealed_neighbors()), 0),
+                 numbered.num_flags_left)
+                for numbered in component
+            ]
+
+            forced = find_forced(len(unrevealed), constraints)
+            if not forced:
+                continue
+
+            safe, mines = forced
+            plan = ([('click', unrevealed[bit]) for bit in iter_bits(safe)] +
+                    [('right_click', unrevealed[bit]) for bit in iter_bits(mines)])
+            if plan:
+                yield plan
+
     def first_click(self):
         if not self._revealed:
             # For our first turn, choose an edge
@@ -394,16 +547,16 @@ class AttemptUnoDirector(RandomExpansionDirector):
     def endgame_obvious(self):
         """Click on any remaining unrevealed cells if all mines are gone"""
         if self.control.get_mines_left() == 0:
-            yield [('click', c) for c in self._cells if c.is_unrevealed()]
+            yield [('click', c) for c in self.unrevealed_cells()]
 
     def endgame_insight(self):
         """Inference of final action deduced from number of mines left"""
-        in_play_numbered = [c for c in self._numbered if c.num_flags_left]
-        in_play_unrevealed = [c.get_neighbors(is_unrevealed=True)
+        in_play_numbered = [c for c in self.numbered_cells() if c.num_flags_left]
+        in_play_unrevealed = [c.get_unrevealed_neighbors()
                               for c in in_play_numbered]
         shared = reduce(operator.and_, in_play_unrevealed, set())
 
-        total_unrevealed = sum(1 for c in self._cells if c.is_unrevealed())
+        total_unrevealed = len(self._unrevealed)
         num_mines_left = self.control.get_mines_left()
         if num_mines_left == len(shared):
             yield [('right_click', c) for c in shared]
@@ -414,10 +567,10 @@ class AttemptUnoDirector(RandomExpansionDirector):
         # If no other good choice, expand randomly in a cardinal direction
         # This gives a better chance of being able to use deductive reasoning
         # with groups next turn.
-        graph = CellGraph(self._numbered, lambda c: c.get_neighbors(is_unrevealed=True))
+        graph = self._graph
         highest_chances = {}
-        for cell in self._numbered:
-            unrevealed = cell.get_neighbors(is_unrevealed=True)
+        for cell in self.numbered_cells():
+            unrevealed = cell.get_unrevealed_neighbors()
             if not unrevealed:
                 continue
 
@@ -432,7 +585,7 @@ class AttemptUnoDirector(RandomExpansionDirector):
             necessary = cell.num_flags_left
             if highest_grouper:
                 necessary -= highest_num_flags_left
-                neighbors = highest_grouper.get_neighbors(is_unrevealed=True)
+                neighbors = highest_grouper.get_unrevealed_neighbors()
                 unrevealed -= neighbors
                 logger.debug('Lowered num flags left of %s from %s to %s, by '
                              'removing unrevealed neighbors of %s: %s',
@@ -465,9 +618,11 @@ class AttemptUnoDirector(RandomExpansionDirector):
         # These will allow further deductive reasoning, depending on the number.
         grouper_contenders = []
         for contender in contenders:
-            graph = CellGraph(self._numbered + [contender],
-                              lambda c: c.get_neighbors(is_unrevealed=True) - {contender})
-            grouping_neighbors = graph.relatives_contained_by(contender)
+            # Ask the graph as if the contender were revealed, without
+            # rebuilding it to include her.
+            grouping_neighbors = graph.objects_contained_by(
+                graph.get_unrevealed_coords(contender),
+                ignore={(contender.x, contender.y)})
             if grouping_neighbors:
                 logger.debug('Found grouper contender %s having subset-sharing '
                              'neighbors %s',
@@ -488,11 +643,11 @@ class AttemptUnoDirector(RandomExpansionDirector):
         # If no cardinal neighbor found, fall back to random expansion
         choices = {
             neighbor
-            for cell in self._numbered
-            for neighbor in cell.get_neighbors(is_unrevealed=True)
+            for cell in self.numbered_cells()
+            for neighbor in cell.get_unrevealed_neighbors()
         }
 
         return [[('click', cell)] for cell in choices]
 
     def choose_randomly(self):
-        return [[('click', cell)] for cell in self._cells if cell.is_unrevealed()]
+        return [[('click', cell)] for cell in self._unrevealed]
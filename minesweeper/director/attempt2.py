@@ -1,22 +1,89 @@
 import logging
-import operator
+import multiprocessing
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 from copy import copy
-from functools import reduce
-from itertools import chain
-from typing import Iterable, Tuple, Set, Optional, Union, Any
-
-from minesweeper.datastructures import PropertyGraph
-from minesweeper.director.base import Director, Cell, register_director
+from itertools import chain, islice
+from random import SystemRandom
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from minesweeper.datastructures import DisjointSet, PropertyGraph, with_bitsets
+from minesweeper.director.base import (
+    Cell,
+    Deadline,
+    DeadlineExceeded,
+    Director,
+    register_director,
+)
+from minesweeper.linalg import find_forced
+from minesweeper.patterns import get_pattern_table, windows_touching
+from minesweeper.probability import (
+    BoardProbabilities,
+    Constraint,
+    SystemSolver,
+    SystemTable,
+    combine_systems,
+    solve_system,
+)
+from minesweeper.util import iter_bits, popcount
+
+random = SystemRandom()
 
 logger = logging.getLogger(__name__)
 
 
+class CellIndex:
+    """System-local numbering of cells, so sets of them may be int bitmasks"""
+
+    __slots__ = ('cells', '_bits')
+
+    def __init__(self, cells: Iterable[Cell]):
+        self.cells: Tuple[Cell, ...] = tuple(cells)
+        self._bits = {cell: 1 << i for i, cell in enumerate(self.cells)}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def mask_of(self, cells: Iterable[Cell]) -> int:
+        mask = 0
+        for cell in cells:
+            mask |= self._bits[cell]
+        return mask
+
+    def cells_of(self, mask: int) -> FrozenSet[Cell]:
+        return frozenset(self.cells[bit] for bit in iter_bits(mask))
+
+
 class Group:
-    """A set of cells and the known number of mines among them"""
+    """A set of cells and the known number of mines among them
 
-    def __init__(self, num_mines: Union[float, int], unrevealed_cells: Iterable[Cell]):
+    The cells are stored as a bitmask over the CellIndex of their system.
+    """
+
+    __slots__ = ('num_mines', 'mask', 'index', '_len')
+
+    def __init__(self, num_mines: Union[float, int], mask: int, index: CellIndex):
         self.num_mines = num_mines
-        self.cells = frozenset(unrevealed_cells)
+        self.mask = mask
+        self.index = index
+        self._len = popcount(mask)
+
+    @classmethod
+    def of(cls, num_mines: Union[float, int], unrevealed_cells: Iterable[Cell],
+           index: CellIndex) -> 'Group':
+        return cls(num_mines, index.mask_of(unrevealed_cells), index)
 
     def __repr__(self):
         return f'{self.__class__.__name__}{repr(self.deconstruct())}'
@@ -24,46 +91,56 @@ class Group:
     def deconstruct(self):
         return self.num_mines, self.cells
 
+    @property
+    def cells(self) -> FrozenSet[Cell]:
+        return self.index.cells_of(self.mask)
+
+    def bits(self) -> Iterable[int]:
+        return iter_bits(self.mask)
+
     def __hash__(self):
-        return hash(self.deconstruct())
+        return hash((self.num_mines, self.mask))
 
     def __eq__(self, other: 'Group'):
         assert isinstance(other, Group)
-        return self.deconstruct() == other.deconstruct()
+        return self.num_mines == other.num_mines and self.mask == other.mask
 
     def __len__(self):
-        return len(self.cells)
+        return self._len
 
     @property
     def probability(self):
         return self.num_mines / len(self)
 
     def difference(self, other: 'Group') -> 'Group':
-        assert other.cells
-        assert other.cells.issubset(self.cells)
+        assert other.mask
+        assert not other.mask & ~self.mask
         assert self.num_mines - other.num_mines >= 0
-        return Group(self.num_mines - other.num_mines, self.cells - other.cells)
+        return Group(self.num_mines - other.num_mines, self.mask & ~other.mask, self.index)
 
     def __sub__(self, other: 'Group') -> 'Group':
         return self.difference(other)
 
     def remove_possibilities(self, cells: Iterable[Cell]) -> 'Group':
         """Remove unrevealed cells from the group"""
-        cells = frozenset(cells)
-        assert cells
-        assert len(self.cells) - len(cells) >= self.num_mines
-        return Group(self.num_mines, self.cells - cells)
+        return self._remove_mask(self.index.mask_of(cells))
+
+    def _remove_mask(self, mask: int) -> 'Group':
+        assert mask
+        remaining = self.mask & ~mask
+        assert popcount(remaining) >= self.num_mines
+        return Group(self.num_mines, remaining, self.index)
 
     def __xor__(self, other):
         assert isinstance(other, Group)
-        return self.remove_possibilities(other.cells)
+        return self._remove_mask(other.mask)
 
 
-class GroupGraph(PropertyGraph[Group, Cell]):
-    """Relate groups by the cells they refer to"""
+class GroupGraph(PropertyGraph[Group, int]):
+    """Relate groups by the (system-local bits of) cells they refer to"""
 
     def __init__(self, groups: Iterable[Group] = None):
-        super().__init__(groups, lambda group: group.cells)
+        super().__init__(groups, lambda group: group.bits())
 
 
 UNSET = object()
@@ -72,147 +149,138 @@ UNSET = object()
 class System(frozenset):
     """A set of cells which are completely independent of other board cells"""
 
-    __slots__ = ('unrevealed', 'edges', 'minimum', 'maximum', 'groups')
+    __slots__ = ('unrevealed', 'edges', 'groups', 'index')
 
     def __new__(cls, unrevealed: Iterable[Cell], edges: Iterable[Cell], *args, **kwargs):
         return super().__new__(cls, chain(unrevealed, edges))
 
     def __init__(self,
                  unrevealed: Iterable[Cell], edges: Iterable[Cell],
-                 minimum: int=None, maximum: int=None,
-                 groups=()):
+                 groups=(), index: CellIndex=None):
         self.unrevealed = frozenset(unrevealed)
+        # Cells are numbered by idx, so the same cells always get the same bits
+        self.index = index or CellIndex(sorted(self.unrevealed, key=lambda cell: cell.idx))
         self.edges = frozenset(edges)
-        self.minimum = 0 if minimum is None else minimum
-        self.maximum = len(self.unrevealed) if maximum is None else maximum
         self.groups = frozenset(groups or ())
         super(System, self).__init__()
 
     def __copy__(self):
         return self.__class__(self.unrevealed, self.edges,
-                              minimum=self.minimum, maximum=self.maximum,
-                              groups=self.groups)
+                              groups=self.groups, index=self.index)
 
     def __hash__(self):
-        return hash((frozenset(self), self.minimum, self.maximum, self.groups))
+        return hash((frozenset(self), self.groups))
 
-    @classmethod
-    def trace(cls, start: Cell, maximum=None) -> 'System':
-        """Find all cells of a system, given an unrevealed cell"""
-        assert start.is_unrevealed()  # sanity check
-
-        unrevealed = set()
-        edges = set()
-
-        walked = set()
-        unrevealed_queue = {start}
-        number_queue = set()
-
-        while unrevealed_queue or number_queue:
-            walked |= unrevealed_queue | number_queue
-            unrevealed |= unrevealed_queue
-            edges |= number_queue
-
-            all_queued = unrevealed_queue | number_queue
-            number_queue = {
-                neighbor
-                for cell in unrevealed_queue
-                for neighbor in cell.get_neighbors(is_number=True)
-            } - walked
-            unrevealed_queue = {
-                neighbor
-                for cell in all_queued
-                for neighbor in cell.get_neighbors(is_unrevealed=True)
-            } - walked
-
-        system = cls(unrevealed, edges, maximum=maximum)
-        system.groups = frozenset(cls.find_visible_groups(system))
+    def signature(self) -> Tuple:
+        """Canonical description of everything the system's solution relies on
 
-        return system
+        That is, each numbered edge cell, the mines it has left to find, and the
+        unrevealed cells it may find them in -- all by idx.
+        """
+        return tuple(sorted(
+            (edge.idx,
+             edge.num_flags_left,
+             tuple(sorted(cell.idx for cell in edge.get_unrevealed_neighbors())))
+            for edge in self.edges
+        ))
+
+    def constraints(self) -> Tuple[int, List[Constraint]]:
+        """The system in the compact form taken by minesweeper.probability"""
+        return len(self.index), [(group.mask, group.num_mines) for group in self.groups]
 
     @staticmethod
-    def find_visible_groups(cells) -> Iterable[Group]:
+    def find_visible_groups(cells, index: CellIndex) -> Iterable[Group]:
         """Find groups by naively matching numbers to their unrevealed neighbours
 
-        This method may return subsets or duplicates of other groups.
+        This method may return subsets or duplicates of other groups. Unrevealed
+        cells touching no number are not grouped; they belong to the Sea.
         """
-        cells = tuple(cells)
-        remaining_unrevealed = {cell for cell in cells if cell.is_unrevealed()}
-        numbered = {cell for cell in cells if cell.is_number()}
-
-        for cell in numbered:
-            unrevealed = cell.get_neighbors(is_unrevealed=True)
-            if not unrevealed:
+        for cell in cells:
+            if not cell.is_number():
                 continue
 
-            yield Group(cell.num_flags_left, unrevealed)
-            remaining_unrevealed.difference_update(unrevealed)
-
-        if remaining_unrevealed:
-            # XXX: this may not accurately represent the number of mines left in
-            #      the unrevealed cells which don't touch a number.
-            # Is there any more informed way to set this?
-            # Does it matter, pragmatically?
-            # Is there a way to refactor, such that the pragmatics match the semantics?
-            yield Group(float('Inf'), remaining_unrevealed)
+            unrevealed = cell.get_unrevealed_neighbors()
+            if unrevealed:
+                yield Group.of(cell.num_flags_left, unrevealed, index)
 
-    def simplify(self, maximum: int=None) -> 'System':
+    def simplify(self) -> 'System':
         """Return a more compact representation of the system, if possible
+
+        Groups are reduced from a worklist, smallest first: whenever a group
+        contains another, it's replaced by their difference, and only the
+        groups overlapping that difference are examined again.
         """
         system = copy(self)
-        if maximum is not None:
-            system.maximum = maximum
-
-        graph = GroupGraph(system.groups)
+        graph = with_bitsets(GroupGraph)(system.groups)
 
-        clean = False
-        while not clean:
-            clean = True
+        worklist = deque(sorted(graph, key=len))
+        queued = set(worklist)
 
-            groups: Iterable[Group] = sorted(graph, key=len)
+        def enqueue(groups: Iterable[Group]):
             for group in groups:
-                contained_groups = graph.relatives_contained_by(group)
-
-                if contained_groups:
-                    clean = False
-
-                    for contained in contained_groups:
-                        if contained.probability == group.probability:
-                            graph.remove(contained)
-
-                        elif contained.probability == 0:
-                            graph.remove(group)
-                            graph.add(group ^ contained)
-
-                        else:
-                            # XXX: I assume this will throw if game state is impossible...
-                            #      Let's hope this comment doesn't go stale.
-                            #      Oh, mother, tell your children not to do what I have done.
-                            #      Spend your life in putoffance and technical debt
-                            #      In the house of the rising-- oh shit, it's 5AM already?
-                            graph.remove(group)
-                            graph.add(group - contained)
-
-        independents = {group
-                        for group in graph.get_independent_objects()
-                        if group.num_mines < float('inf')}
-        independent_mines = sum(independent.num_mines for independent in independents)
-        if independent_mines == system.maximum:
-            other_groups = set(graph) - independents
-            other_cells = {cell for group in other_groups for cell in group.cells}
-            if other_cells:
-                graph = GroupGraph(independents | {Group(0, other_cells)})
+                if group not in queued:
+                    queued.add(group)
+                    worklist.append(group)
+
+        while worklist:
+            group = worklist.popleft()
+            queued.discard(group)
+            if group not in graph:
+                continue
+
+            for contained in graph.relatives_contained_by(group):
+                if contained.mask == group.mask:
+                    # A duplicate of the cells we cover tells us nothing new
+                    graph.remove(contained)
+                    continue
+
+                # XXX: I assume this will throw if game state is impossible...
+                #      Let's hope this comment doesn't go stale.
+                #      Oh, mother, tell your children not to do what I have done.
+                #      Spend your life in putoffance and technical debt
+                #      In the house of the rising-- oh shit, it's 5AM already?
+                reduced = group - contained
+                graph.remove(group)
+                graph.add(reduced)
+                enqueue((reduced,))
+                enqueue(graph.relatives_of(reduced))
+                break
 
         system.groups = frozenset(graph)
         return system
 
 
+class Sea:
+    """The unrevealed cells touching no number, tracked only by their count"""
+
+    def __init__(self, size: int, get_cells: Callable[[], Iterable[Cell]]):
+        self.size = size
+        self._get_cells = get_cells
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(size={self.size})'
+
+    def cells(self) -> Iterator[Cell]:
+        """Lazily find the sea's cells, for when they must be acted upon"""
+        return iter(self._get_cells())
+
+    def choose_randomly(self) -> Optional[Cell]:
+        """Return a random cell of the sea, or None if it's empty"""
+        if not self.size:
+            return None
+        return next(islice(self.cells(), random.randrange(self.size), None), None)
+
+
 def flatten_groups(groups: Iterable[Group]) -> Iterable[Tuple[float, Cell]]:
     """Determine probability of each cell using info from the passed groups
     """
     graph = GroupGraph(groups)
-    for cell in graph.all_props():
-        containers = graph.objects_containing(cell)
+    for bit in graph.all_props():
+        containers = graph.objects_containing(bit)
+        cell = next(iter(containers)).index.cells[bit]
         yield max(group.probability for group in containers), cell
 
 
@@ -237,15 +305,51 @@ def exec_moves(moves: Iterable[Union[Tuple[str, Cell], Tuple[str, Cell, Any]]],
                          method_name.upper(), cell.x, cell.y, message, extra_message)
 
 
-def find_systems(cells: Iterable[Cell], maximum: int=None) -> Iterable[System]:
-    """Find all groups of cells separated from other groups
+def find_systems(cells: Iterable[Cell]) -> Tuple[List[System], Sea]:
+    """Partition unrevealed cells into independent systems and the sea
+
+    This is a single pass over the board: each number joins (by idx) its
+    unrevealed neighbours into one system. Unrevealed cells which no number
+    touches are only counted, forming the sea.
     """
-    cells = {cell for cell in cells if cell.is_unrevealed()}
+    cells = tuple(cells)
+    components: DisjointSet[int] = DisjointSet()
+    frontier = {}
+    num_unrevealed = 0
+
+    for cell in cells:
+        if cell.is_unrevealed():
+            num_unrevealed += 1
+
+        elif cell.is_number():
+            unrevealed = cell.get_unrevealed_neighbors()
+            if not unrevealed:
+                continue
+
+            frontier[cell.idx] = cell
+            components.add(cell.idx)
+            for neighbor in unrevealed:
+                frontier[neighbor.idx] = neighbor
+                components.add(neighbor.idx)
+                components.union(cell.idx, neighbor.idx)
+
+    systems = []
+    num_constrained = 0
+    for idxs in components.groups():
+        members = [frontier[idx] for idx in idxs]
+        unrevealed = [cell for cell in members if cell.is_unrevealed()]
+        edges = [cell for cell in members if cell.is_number()]
+        num_constrained += len(unrevealed)
 
-    while cells:
-        system = System.trace(cells.pop(), maximum=maximum)
-        yield system
-        cells -= system.unrevealed
+        system = System(unrevealed, edges)
+        system.groups = frozenset(System.find_visible_groups(edges, system.index))
+        systems.append(system)
+
+    sea = Sea(num_unrevealed - num_constrained,
+              lambda: (cell for cell in cells
+                       if cell.is_unrevealed() and cell.idx not in frontier))
+
+    return systems, sea
 
 
 def split_moves(groups: Iterable[Group]
@@ -263,61 +367,329 @@ def split_moves(groups: Iterable[Group]
     return moves, probabilities
 
 
+class CachedSolution:
+    """What's been learned of a system, kept for as long as its cells don't change
+
+    Groups are stored as (mask, mines) pairs, as a system's bits depend only on
+    its cells, and so are shared by any system with the same signature.
+
+    A system not solved in time keeps its solver (or, if it's being solved in
+    the pool, its future), so the next step carries on where this one stopped.
+    """
+
+    __slots__ = ('num_cells', 'groups', 'idxs', 'forced', 'table', 'solver', 'pending')
+
+    def __init__(self, system: System):
+        self.num_cells = len(system.index)
+        self.groups: Tuple[Constraint, ...] = tuple(
+            (group.mask, group.num_mines) for group in system.groups)
+        self.idxs: FrozenSet[int] = frozenset(cell.idx for cell in system)
+        self.forced: Optional[Tuple[int, int]] = None
+        self.table: Optional[SystemTable] = None
+        self.solver: Optional[SystemSolver] = None
+        self.pending: Optional[Future] = None
+
+    def constraints(self) -> Tuple[int, List[Constraint]]:
+        return self.num_cells, list(self.groups)
+
+    def restore(self, system: System) -> System:
+        """Return a copy of the passed system, simplified as it was before"""
+        system = copy(system)
+        system.groups = frozenset(Group(mines, mask, system.index)
+                                  for mask, mines in self.groups)
+        return system
+
+
 @register_director('attempt2')
 class AttemptDosDirector(Director):
     """Strategies based on a heat map of mine probabilities"""
 
-    def act(self):
+    def __init__(self, *args, **kwargs):
+        # Number of simplified and solved systems to remember between steps
+        self.solution_cache_size = kwargs.pop('solution_cache_size', 256)
+        # Number of worker processes to solve large systems in. By default,
+        # every system is solved in this process.
+        self.solver_processes = kwargs.pop('solver_processes', 0)
+        # Minimum number of unrevealed cells in a system worth sending to a
+        # worker process; smaller ones are quicker to solve than to pickle.
+        self.parallel_threshold = kwargs.pop('parallel_threshold', 24)
+
+        super(AttemptDosDirector, self).__init__(*args, **kwargs)
+
+        self._solutions: Dict[Tuple, CachedSolution] = OrderedDict()
+        self._solutions_by_idx: Dict[int, Set[Tuple]] = defaultdict(set)
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # We're called from the director thread, while pygame runs in the
+            # main one. Forking would copy whatever locks those threads held
+            # into the workers, so they're started fresh instead.
+            self._pool = ProcessPoolExecutor(max_workers=self.solver_processes,
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def close(self):
+        if self._pool is not None:
+            # Systems not yet begun are dropped, but those being solved are
+            # seen through, so their workers exit once they're done
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def reset(self):
+        for signature in list(self._solutions):
+            self._evict(signature)
+
+    def act(self, deadline: Deadline = None):
+        deadline = deadline or Deadline()
         total_mines_left = self.control.get_mines_left()
         all_cells = self.control.get_cells()
 
-        systems = None
-        next_systems = frozenset(find_systems(all_cells, maximum=total_mines_left))
+        self.forget_dirty_solutions()
 
-        moves = []
-        probabilities = []
-
-        while systems != next_systems:
-            logger.info('Simplifying systems')
-
-            moves = []
-            probabilities = []
-
-            systems = frozenset(next_systems)
-            next_systems = set()
-            maximum = total_mines_left - sum(system.minimum for system in systems)
+        # Common local patterns are cheaper to look up than to solve for
+        moves = list(self.find_pattern_moves())
+        if moves:
+            logger.info('Matched patterns...')
+            exec_moves(set(moves))
+            return
 
-            for system in systems:
-                system = system.simplify(maximum=maximum)
-                next_systems.add(system)
-                proposed_moves, remaining_probabilities = split_moves(system.groups)
-                moves.extend(proposed_moves)
-                probabilities.extend(remaining_probabilities)
+        systems, sea = find_systems(all_cells)
 
-            if moves:
-                logger.info('Found moves...')
-                break
+        # Systems are simplified without regard to the mines left on the board,
+        # so what's learned depends only on the cells each one spans, and may
+        # be reused until they change. The board's mine count is instead
+        # accounted for by the exact solver.
+        logger.info('Simplifying systems')
+        solutions = [self.lookup_solution(system) for system in systems]
+        systems = [solution.restore(system) for solution, system in zip(solutions, systems)]
 
-        systems = next_systems
-        logger.info('Finished simplifying')
+        moves = []
+        for system in systems:
+            proposed_moves, _ = split_moves(system.groups)
+            moves.extend(proposed_moves)
 
         if moves:
+            logger.info('Found moves...')
             exec_moves(set(moves))
+            return
+
+        if deadline.expired():
+            logger.info('Out of time after simplifying; guessing')
+            self.act_heuristically(systems, sea)
+            return
+
+        # Eliminating between constraints finds what subsets alone can't,
+        # still without enumerating any configurations.
+        logger.info('Reducing systems')
+        for solution, system in zip(solutions, systems):
+            moves.extend(self.deduce(solution, system))
+            if deadline.expired():
+                break
 
+        if moves:
+            logger.info('Deduced moves...')
+            exec_moves(moves)
+            return
+
+        if not systems:
+            # Nothing constrains any cell (e.g. our first move), so dive in
+            self.click_sea(sea)
+            return
+
+        # Display each system, for visual debugging purposes. And 'cause it
+        # looks pretty, I guess.
+        for system in systems:
+            for cell in system.unrevealed:
+                cell.mark1()
+            for cell in system.edges:
+                cell.mark2()
+
+        logger.info('Solving systems')
+        try:
+            board = self.solve(solutions, sea, total_mines_left, deadline)
+        except DeadlineExceeded:
+            # Systems solved in time stay cached, and the rest keep their
+            # progress, for the next step
+            logger.info('Out of time while solving %d of %d systems; guessing',
+                        sum(1 for solution in solutions if solution.table is None),
+                        len(solutions))
+            self.act_heuristically(systems, sea)
+            return
+
+        if board is None:
+            logger.warning('No arrangement of mines fits the board; guessing')
+            self.act_heuristically(systems, sea)
         else:
-            assert probabilities
-
-            # Display each system, for visual debugging purposes. And 'cause it
-            # looks pretty, I guess.
-            for system in systems:
-                for cell in system.unrevealed:
-                    cell.mark1()
-                for cell in system.edges:
-                    cell.mark2()
-
-            probabilities = list(probabilities)
-            probabilities.sort(key=lambda t: t[0])
-            probability, cell = probabilities[0]
-            exec_moves([
-                ('click', cell, probability)
-            ])
+            self.act_on_probabilities(systems, sea, board)
+
+    def find_pattern_moves(self) -> Iterator[Tuple[str, Cell, str]]:
+        """Yield moves forced by known local patterns around the changed cells"""
+        table = get_pattern_table()
+        for cell in windows_touching(self.control.get_dirty_cells()):
+            found = table.lookup_cell(cell)
+            if found:
+                safe, mines = found
+                for neighbor in safe:
+                    yield 'click', neighbor, 'PATTERN'
+                for neighbor in mines:
+                    yield 'right_click', neighbor, 'PATTERN'
+
+    def forget_dirty_solutions(self):
+        """Evict cached solutions of any system whose cells have changed"""
+        for cell in self.control.get_dirty_cells():
+            for signature in self._solutions_by_idx.pop(cell.idx, ()):
+                self._evict(signature)
+
+    def lookup_solution(self, system: System) -> 'CachedSolution':
+        """Return the cached solution of a system, simplifying it if unseen"""
+        signature = system.signature()
+        solution = self._solutions.get(signature)
+        if solution is not None:
+            self._solutions.move_to_end(signature)
+            return solution
+
+        solution = CachedSolution(system.simplify())
+        self._solutions[signature] = solution
+        for cell in chain(system.unrevealed, system.edges):
+            self._solutions_by_idx[cell.idx].add(signature)
+
+        while len(self._solutions) > self.solution_cache_size:
+            oldest = next(iter(self._solutions))
+            self._evict(oldest)
+
+        return solution
+
+    def _evict(self, signature: Tuple):
+        solution = self._solutions.pop(signature, None)
+        if solution is None:
+            return
+        if solution.pending is not None:
+            # Only drops a system not yet begun; a worker already solving one
+            # carries on until it's done
+            solution.pending.cancel()
+        for idx in solution.idxs:
+            signatures = self._solutions_by_idx.get(idx)
+            if signatures is not None:
+                signatures.discard(signature)
+                if not signatures:
+                    del self._solutions_by_idx[idx]
+
+    def deduce(self, solution: 'CachedSolution', system: System
+               ) -> Iterator[Tuple[str, Cell, str]]:
+        """Yield the moves forced by row-reducing the system's constraints"""
+        if solution.forced is None:
+            solution.forced = find_forced(*solution.constraints()) or (0, 0)
+
+        safe, mines = solution.forced
+        for cell in system.index.cells_of(safe):
+            yield 'click', cell, 'REDUCED'
+        for cell in system.index.cells_of(mines):
+            yield 'right_click', cell, 'REDUCED'
+
+    def solve(self, solutions: List['CachedSolution'], sea: Sea, mines_left: int,
+              deadline: Deadline = None) -> Optional[BoardProbabilities]:
+        """Find the exact probability of a mine under each unrevealed cell
+
+        Raises DeadlineExceeded if the deadline passes before all are solved.
+        """
+        deadline = deadline or Deadline()
+        unsolved = [solution for solution in solutions if solution.table is None]
+
+        # When there are several large systems, they're shipped off to share
+        # among workers in their compact form (bitmasks and mine counts), and
+        # solved while we work through the small ones. Only the table comes
+        # back, so a worker sees its system through, however many steps that
+        # takes, rather than its search being sent back and forth each step.
+        if self.solver_processes:
+            large = [solution for solution in unsolved
+                     if solution.num_cells >= self.parallel_threshold]
+            if len(large) > 1:
+                pool = self.get_pool()
+                for solution in large:
+                    if solution.pending is None and solution.solver is None:
+                        solution.pending = pool.submit(solve_system, *solution.constraints())
+
+        for solution in unsolved:
+            if solution.pending is None:
+                if solution.solver is None:
+                    solution.solver = SystemSolver(*solution.constraints())
+                solution.table = solution.solver.run(deadline)
+                solution.solver = None
+        for solution in unsolved:
+            if solution.pending is not None:
+                self.collect_solution(solution, deadline)
+
+        tables = [solution.table for solution in solutions]
+        return combine_systems(tables, sea.size, mines_left)
+
+    def collect_solution(self, solution: 'CachedSolution', deadline: Deadline):
+        """Wait for a system being solved in the pool
+
+        A system still unsolved when the deadline passes is left to its worker,
+        and collected on a later step.
+        """
+        try:
+            solution.table = solution.pending.result(timeout=deadline.timeout())
+        except FutureTimeoutError:
+            raise DeadlineExceeded
+        solution.pending = None
+
+    def act_on_probabilities(self, systems: List[System], sea: Sea,
+                             board: BoardProbabilities):
+        moves = []
+        candidates = []
+        for s, system in enumerate(systems):
+            for bit, cell in enumerate(system.index.cells):
+                if board.is_safe(s, bit):
+                    moves.append(('click', cell, 'SAFE'))
+                elif board.is_mine(s, bit):
+                    moves.append(('right_click', cell, 'MINE'))
+                else:
+                    candidates.append((board.probability(s, bit), cell))
+
+        if sea.size:
+            if board.sea_weight == 0:
+                moves.extend(('click', cell, 'SEA') for cell in sea.cells())
+            elif board.sea_weight == board.total:
+                moves.extend(('right_click', cell, 'SEA') for cell in sea.cells())
+            else:
+                candidates.append((board.sea_probability, None))
+
+        if moves:
+            exec_moves(moves)
+            return
+
+        probability, cell = min(candidates, key=lambda t: t[0])
+        if cell is None:
+            self.click_sea(sea, probability)
+            return
+        exec_moves([
+            ('click', cell, probability)
+        ])
+
+    def act_heuristically(self, systems: List[System], sea: Sea):
+        """Click the cell whose most pessimistic group is least likely a mine"""
+        probabilities = [
+            probability
+            for system in systems
+            for probability in flatten_groups(system.groups)
+        ]
+        if not probabilities:
+            self.click_sea(sea)
+            return
+
+        probability, cell = min(probabilities, key=lambda t: t[0])
+        exec_moves([
+            ('click', cell, probability)
+        ])
+
+    def click_sea(self, sea: Sea, message='SEA'):
+        """Click a random cell of the sea, if there's any left"""
+        cell = sea.choose_randomly()
+        if cell is None:
+            logger.warning('No unrevealed cells left to click')
+            return
+        exec_moves([
+            ('click', cell, message)
+        ])
@@ -1,8 +1,9 @@
 """
 A director controls the game, seeing only what a player might see.
 """
+import time
 from itertools import starmap
-from typing import Set, Iterable
+from typing import FrozenSet, Iterable, Optional, Set
 
 from minesweeper.raytrace import int_trace
 from minesweeper.util import apply_method_filter
@@ -32,10 +33,11 @@ def register_director(cls, slug=None):
 
 class BaseControl(object):
     """Middleman between directors and the Game"""
-    __slots__ = ('_history',)
+    __slots__ = ('_history', '_neighbor_stats')
 
     def __init__(self):
         self._history = []
+        self._neighbor_stats = {}
 
     def click(self, x, y):
         """Click the cell at grid x & y.
@@ -117,6 +119,38 @@ class BaseControl(object):
     def reset_cache(self):
         pass
 
+    def get_neighbor_stats(self, cell: 'Cell') -> 'NeighborStats':
+        """Return stats about the neighbours of a cell, memoized by idx
+
+        Stats are kept until the cell or one of its neighbours changes. Controls
+        must call invalidate_neighbor_stats() with the cells they change.
+        """
+        stats = self._neighbor_stats.get(cell.idx)
+        if stats is None:
+            stats = self._neighbor_stats[cell.idx] = NeighborStats(cell)
+        return stats
+
+    def invalidate_neighbor_stats(self, cells: Iterable['Cell']):
+        """Forget the neighbour stats of the passed cells and their neighbours"""
+        width, height = self.get_board_size()
+        for cell in cells:
+            for d_x, d_y in ((0, 0),) + Cell.get_neighbor_deltas():
+                x, y = cell.x + d_x, cell.y + d_y
+                if 0 <= x < width and 0 <= y < height:
+                    self._neighbor_stats.pop(x * height + y, None)
+
+
+class NeighborStats(object):
+    """Facts about a cell's neighbours, which are costly to recompute"""
+    __slots__ = (
+        'unrevealed',
+        'num_flagged',
+    )
+
+    def __init__(self, cell: 'Cell'):
+        self.unrevealed: FrozenSet['Cell'] = frozenset(cell.get_neighbors(is_unrevealed=True))
+        self.num_flagged: int = len(cell.get_neighbors(is_flagged=True))
+
 
 class Cell(object):
     TYPE_NUMBER0 = 0
@@ -269,6 +303,10 @@ class Cell(object):
     def get_neighbors(self, **filters) -> Set['Cell']:
         return self._get_neighbours(self.get_neighbor_deltas(), **filters)
 
+    def get_unrevealed_neighbors(self) -> FrozenSet['Cell']:
+        """Memoized equivalent of get_neighbors(is_unrevealed=True)"""
+        return self._control.get_neighbor_stats(self).unrevealed
+
     def get_cardinal_neighbors(self, **filters) -> Set['Cell']:
         return self._get_neighbours(self.get_cardinal_neighbor_deltas(), **filters)
 
@@ -312,7 +350,52 @@ class Cell(object):
 
     @property
     def num_flags_left(self):
-        return self.number - len(self.get_neighbors(is_flagged=True))
+        return self.number - self._control.get_neighbor_stats(self).num_flagged
+
+
+class DeadlineExceeded(Exception):
+    """Raised by Deadline.check() once a director's time budget is spent"""
+
+
+class Deadline(object):
+    """A point in time by which a director ought to have finished acting
+
+    Directors work in stages, cheapest first, checking the deadline between
+    (and within) them. When it passes, they act on the best moves found so far.
+    """
+    __slots__ = ('expires_at',)
+
+    def __init__(self, expires_at: Optional[float] = None):
+        #: time.monotonic() at which the budget is spent; None for never
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: Optional[float]) -> 'Deadline':
+        """Return a deadline the passed number of seconds from now"""
+        if seconds is None:
+            return cls()
+        return cls(time.monotonic() + seconds)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(remaining={self.remaining():.3f})'
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float('inf')
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self) -> Optional[float]:
+        """Seconds remaining, or None if unbounded -- as APIs taking a timeout expect"""
+        if self.expires_at is None:
+            return None
+        return self.remaining()
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceeded
 
 
 class Director(object):
@@ -333,5 +416,11 @@ class Director(object):
     def reset(self):
         """Called by the game, when the board resets."""
 
-    def act(self):
-        """Called by the game. Act on the board here."""
+    def close(self):
+        """Called by the game, when it exits. Release any resources here."""
+
+    def act(self, deadline: Deadline = None):
+        """Called by the game. Act on the board here.
+
+        If passed, the deadline bounds how long to think before acting.
+        """
@@ -1,47 +1,51 @@
+import csv
+import hashlib
+import io
 import logging
-from typing import Dict, Optional, Any
+from datetime import timedelta
 
 import os
+import re
+import uuid
+from functools import lru_cache
 
 from sqlalchemy import (
     Boolean,
     Column,
     create_engine,
+    DDL,
+    event,
     ForeignKey,
-    func,
     Index,
     Integer,
-    literal,
-    or_,
-    Sequence,
+    text,
     UniqueConstraint,
-    update,
-    cast,
 )
-from sqlalchemy.dialects.postgresql import insert, ARRAY, DOUBLE_PRECISION
-from sqlalchemy.ext import baked
-from sqlalchemy.ext.baked import BakedQuery
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import (
-    aliased,
-    relationship,
-    scoped_session,
-    Session,
-    sessionmaker,
-    Query,
-)
-from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.orm import relationship
+from sqlalchemy.schema import CreateIndex, CreateTable
 
-from minesweeper.director.base import Director, register_director, Cell as DirectorCell
+from minesweeper.director.base import Deadline, register_director
+from minesweeper.director.set_logic import CELL_COLUMNS, iter_cell_rows, SetLogicDirector
 
 logger = logging.getLogger(__name__)
 
 
 Model = declarative_base()
 
+# Everything here is scratch, rebuilt from the board whenever it's lost -- so
+# there's no sense paying to write it all to the WAL as well.
+UNLOGGED = {'prefixes': ['UNLOGGED']}
+
 
 class CellNeighbor(Model):
     __tablename__ = 'cell_neighbor'
+    __table_args__ = (
+        UNLOGGED,
+    )
 
     cell_idx = Column(ForeignKey('cell.idx'), primary_key=True)
     neighbor_idx = Column(ForeignKey('cell.idx'), primary_key=True)
@@ -51,9 +55,7 @@ class Cell(Model):
     __tablename__ = 'cell'
     __table_args__ = (
         UniqueConstraint('x', 'y'),
-
-        # This allows us to create neighbour links entirely in-memory
-        Index('cell_x_y_lookup', 'x', 'y', 'idx'),
+        UNLOGGED,
     )
 
     idx = Column(Integer, primary_key=True)
@@ -70,466 +72,551 @@ class Cell(Model):
                              secondaryjoin=CellNeighbor.neighbor_idx == idx)
 
 
+# Cells are updated in place every step, never changing an indexed column. With
+# room left on each page for the new row versions, those updates can stay
+# heap-only (HOT), and need no index maintenance or vacuuming to reclaim.
+CELL_FILLFACTOR = DDL('ALTER TABLE %(table)s SET (fillfactor = 70)')
+event.listen(Cell.__table__, 'after_create', CELL_FILLFACTOR)
+
+
+class CellUpdate(Model):
+    """Cell changes of one step, COPYed in and merged by minesweeper_step()"""
+    __tablename__ = 'cell_update'
+    __table_args__ = (
+        UNLOGGED,
+    )
+
+    idx = Column(Integer, primary_key=True)
+    x = Column(Integer, nullable=False)
+    y = Column(Integer, nullable=False)
+    number = Column(Integer)
+    is_revealed = Column(Boolean, nullable=False)
+    is_flagged = Column(Boolean, nullable=False)
+
+
 class Observation(Model):
     __tablename__ = 'observation'
+    __table_args__ = (
+        # Lets the set-logic passes look up overlapping observations, instead
+        # of comparing every pair
+        Index('observation_cells_lookup', 'cells',
+              postgresql_using='gin',
+              postgresql_ops={'cells': 'gin__int_ops'}),
+        UNLOGGED,
+    )
 
-    id = Column(Integer, Sequence('observation_id_seq'), primary_key=True)
+    id = Column(Integer, primary_key=True)
     cell_idx = Column(Integer, ForeignKey('cell.idx'))
     cells = Column(ARRAY(Integer))
     num_mines_remaining = Column(Integer)
 
 
-@register_director('postgres')
-class PostgresDirector(Director):
-    """Use postgres for the heavy lifting
+# The deduction pipeline runs server-side, so each step costs one round trip.
+# Each function is (re)installed by PostgresDirector.connect() into its game's
+# schema, and (through SET search_path FROM CURRENT) only ever sees that
+# game's tables.
+#
+# NOTE: these are executed without bind params; keep them free of percent signs
+
+#: Insert observations of the passed numbered cells (or all, if NULL): the
+#: unrevealed, unflagged cells around each, and the mines left among them.
+OBSERVE_FUNCTION = '''
+CREATE OR REPLACE FUNCTION minesweeper_observe(_sources integer[])
+RETURNS void
+LANGUAGE sql
+SET search_path FROM CURRENT
+AS $$
+    INSERT INTO observation (cell_idx, cells, num_mines_remaining)
+    SELECT cell.idx,
+           array_agg(neighbor.idx ORDER BY neighbor.idx) FILTER (WHERE NOT neighbor.is_flagged),
+           cell.number - count(*) FILTER (WHERE neighbor.is_flagged)
+    FROM cell
+    JOIN cell_neighbor ON cell_neighbor.cell_idx = cell.idx
+    JOIN cell AS neighbor ON neighbor.idx = cell_neighbor.neighbor_idx
+    WHERE cell.number IS NOT NULL
+      AND NOT neighbor.is_revealed
+      AND (_sources IS NULL OR cell.idx = ANY(_sources))
+    GROUP BY cell.idx, cell.number
+    HAVING count(*) FILTER (WHERE NOT neighbor.is_flagged) > 0
+$$;
+'''
+
+#: Repeatedly split strict subsets out of their supersets, and add the
+#: overlaps of observations whose number of mines is certain, until neither
+#: changes anything (or the time budget, if not NULL, is spent). Returns the
+#: number of passes made.
+#:
+#: For observations A and B sharing cells S, S holds at least
+#: max(0, A's mines - |A - S|, B's mines - |B - S|) mines, and at most
+#: min(|S|, A's mines, B's mines). When those meet, S is observed in its own
+#: right (under A's source cell_idx) -- and the next split takes it out of both.
+#: Observations keep their source cell_idx, however they're split, as they
+#: remain true of the board.
+#:
+#: Each observation looks up its partners by overlap (&&), which the GIN
+#: index on cells answers directly -- rather than every pair of observations
+#: being compared.
+PROPAGATE_FUNCTION = '''
+CREATE OR REPLACE FUNCTION minesweeper_propagate(_time_budget interval)
+RETURNS integer
+LANGUAGE plpgsql
+SET search_path FROM CURRENT
+AS $$
+DECLARE
+    _num_split integer;
+    _num_pinned integer;
+    _num_passes integer := 0;
+BEGIN
+    LOOP
+        UPDATE observation
+        SET cells = observation.cells - split.subset_cells,
+            num_mines_remaining = observation.num_mines_remaining - split.subset_remaining
+        FROM (
+            SELECT superset.id AS superset_id,
+                   subset.cells AS subset_cells,
+                   subset.num_mines_remaining AS subset_remaining
+            FROM observation AS superset
+            CROSS JOIN LATERAL (
+                SELECT candidate.cells, candidate.num_mines_remaining
+                FROM observation AS candidate
+                WHERE candidate.cells && superset.cells
+                  AND candidate.cells <@ superset.cells
+                  AND candidate.cells <> superset.cells
+                ORDER BY cardinality(candidate.cells) DESC
+                LIMIT 1
+            ) AS subset
+        ) AS split
+        WHERE observation.id = split.superset_id;
+        GET DIAGNOSTICS _num_split = ROW_COUNT;
+
+        INSERT INTO observation (cell_idx, cells, num_mines_remaining)
+        SELECT pinned.cell_idx, pinned.cells, pinned.num_mines_remaining
+        FROM (
+            SELECT DISTINCT ON (shared.cells)
+                   constricted.cell_idx,
+                   shared.cells,
+                   bounds.lowest AS num_mines_remaining
+            FROM observation AS constricted
+            JOIN observation AS candidate
+              ON candidate.cells && constricted.cells
+             -- containment is left to the split
+             AND NOT candidate.cells <@ constricted.cells
+             AND NOT candidate.cells @> constricted.cells
+            CROSS JOIN LATERAL (
+                SELECT sort(candidate.cells & constricted.cells) AS cells
+            ) AS shared
+            CROSS JOIN LATERAL (
+                SELECT greatest(
+                           0,
+                           constricted.num_mines_remaining
+                               - (cardinality(constricted.cells) - cardinality(shared.cells)),
+                           candidate.num_mines_remaining
+                               - (cardinality(candidate.cells) - cardinality(shared.cells))
+                       ) AS lowest,
+                       least(
+                           cardinality(shared.cells),
+                           constricted.num_mines_remaining,
+                           candidate.num_mines_remaining
+                       ) AS highest
+            ) AS bounds
+            WHERE bounds.lowest = bounds.highest
+            ORDER BY shared.cells, constricted.cell_idx
+        ) AS pinned
+        WHERE NOT EXISTS (
+            SELECT 1 FROM observation AS existing WHERE existing.cells = pinned.cells
+        );
+        GET DIAGNOSTICS _num_pinned = ROW_COUNT;
+
+        _num_passes := _num_passes + 1;
+        EXIT WHEN _num_split + _num_pinned = 0;
+        EXIT WHEN _num_passes >= 64;
+        EXIT WHEN _time_budget IS NOT NULL
+              AND clock_timestamp() - statement_timestamp() >= _time_budget;
+    END LOOP;
+
+    RETURN _num_passes;
+END
+$$;
+'''
+
+#: Merge the cell changes staged in cell_update (inserting them, the first
+#: time), bring observations up to date, and return the moves to make: certain
+#: clicks and flags if there are any, otherwise a click on the cell least likely
+#: to hold a mine (with the other candidates to mark1), if it beats clicking
+#: blindly. No rows means no idea.
+#:
+#: Past the time budget (if not NULL), propagation is skipped.
+STEP_FUNCTION = '''
+CREATE OR REPLACE FUNCTION minesweeper_step(
+    _first_load boolean,
+    _width integer,
+    _height integer,
+    _mines_left integer,
+    _time_budget interval
+)
+RETURNS TABLE (action text, x integer, y integer)
+LANGUAGE plpgsql
+SET search_path FROM CURRENT
+AS $$
+#variable_conflict use_column
+DECLARE
+    _idxs integer[] := ARRAY(SELECT idx FROM cell_update);
+    _sources integer[];
+    _num_unrevealed integer;
+BEGIN
+    IF _first_load THEN
+        INSERT INTO cell (idx, x, y, number, is_revealed, is_flagged)
+        SELECT idx, x, y, number, is_revealed, is_flagged
+        FROM cell_update;
+
+        -- Neighbours' idx are worked out from their coords (as in the
+        -- director's Cell, idx = x * height + y), rather than searched for
+        INSERT INTO cell_neighbor (cell_idx, neighbor_idx)
+        SELECT cell.idx, (cell.x + d_x) * _height + (cell.y + d_y)
+        FROM cell
+        CROSS JOIN generate_series(-1, 1) AS d_x
+        CROSS JOIN generate_series(-1, 1) AS d_y
+        WHERE (d_x, d_y) <> (0, 0)
+          AND cell.x + d_x BETWEEN 0 AND _width - 1
+          AND cell.y + d_y BETWEEN 0 AND _height - 1;
+
+        TRUNCATE observation;
+        PERFORM minesweeper_observe(NULL);
+
+    ELSIF cardinality(_idxs) > 0 THEN
+        UPDATE cell
+        SET number = changed.number,
+            is_revealed = changed.is_revealed,
+            is_flagged = changed.is_flagged
+        FROM cell_update AS changed
+        WHERE cell.idx = changed.idx;
+
+        -- Every observation, even one split or constricted from others, holds
+        -- until one of its cells is revealed or flagged. So only those of cells
+        -- around the changes, or including them, are rebuilt -- along with
+        -- anything else derived from the same source cells.
+        WITH stale AS (
+            DELETE FROM observation
+            WHERE cell_idx = ANY(_idxs)
+               OR cell_idx IN (SELECT cell_idx FROM cell_neighbor WHERE neighbor_idx = ANY(_idxs))
+               OR cells && _idxs
+            RETURNING cell_idx
+        )
+        SELECT coalesce(array_agg(DISTINCT cell_idx), '{}') INTO _sources FROM stale;
+
+        DELETE FROM observation WHERE cell_idx = ANY(_sources);
+
+        PERFORM minesweeper_observe(
+            _idxs
+            || _sources
+            || ARRAY(SELECT cell_idx FROM cell_neighbor WHERE neighbor_idx = ANY(_idxs))
+        );
+    END IF;
+
+    DELETE FROM cell_update;
+
+    IF _time_budget IS NULL OR clock_timestamp() - statement_timestamp() < _time_budget THEN
+        PERFORM minesweeper_propagate(_time_budget);
+    END IF;
+
+    RETURN QUERY
+    SELECT 'click', cell.x, cell.y
+    FROM observation, unnest(observation.cells) AS revelation (idx)
+    JOIN cell ON cell.idx = revelation.idx
+    WHERE observation.num_mines_remaining = 0
+    UNION
+    SELECT 'right_click', cell.x, cell.y
+    FROM observation, unnest(observation.cells) AS flagellation (idx)
+    JOIN cell ON cell.idx = flagellation.idx
+    WHERE observation.num_mines_remaining = cardinality(observation.cells);
+    IF FOUND THEN
+        RETURN;
+    END IF;
+
+    -- Only guess if the lowest observed probability is less than that of
+    -- hitting a mine when selecting *any* cell at random
+    SELECT count(*) INTO _num_unrevealed
+    FROM cell
+    WHERE NOT cell.is_revealed AND NOT cell.is_flagged;
+
+    RETURN QUERY
+    WITH cell_probabilities AS (
+        SELECT raw.idx, max(raw.probability) AS probability
+        FROM (
+            SELECT unnest(observation.cells) AS idx,
+                   observation.num_mines_remaining::double precision
+                       / cardinality(observation.cells) AS probability
+            FROM observation
+            WHERE cardinality(observation.cells) > 0
+        ) AS raw
+        GROUP BY raw.idx
+    )
+    SELECT CASE WHEN row_number() OVER (ORDER BY cell_probabilities.probability) = 1
+                THEN 'click' ELSE 'mark1' END,
+           cell.x,
+           cell.y
+    FROM cell_probabilities
+    JOIN cell ON cell.idx = cell_probabilities.idx
+    WHERE (SELECT min(probability) FROM cell_probabilities)
+          < _mines_left::double precision / greatest(_num_unrevealed, 1)
+    ORDER BY cell_probabilities.probability;
+END
+$$;
+'''
+
+FUNCTIONS = (OBSERVE_FUNCTION, PROPAGATE_FUNCTION, STEP_FUNCTION)
+
+
+def get_schema_version() -> str:
+    """Digest of all the DDL a game's schema is built with: tables, indexes, functions
+
+    Recorded on each schema as it's built, so one left by an earlier startup is
+    reused as-is, unless the definitions have changed since.
     """
+    dialect = postgresql.dialect()
+    digest = hashlib.sha1()
+    for table in Model.metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    for statement in (CELL_FILLFACTOR.statement,) + FUNCTIONS:
+        digest.update(statement.encode())
+    return f'minesweeper {digest.hexdigest()}'
 
-    def __init__(self, *args, database_url=None, debug=True, **kwargs):
-        super(PostgresDirector, self).__init__(*args, debug=debug, **kwargs)
 
-        if database_url is None:
-            database_url = os.getenv('DATABASE_URL')
+#: Connections each database's pool keeps open, by default
+POOL_SIZE = 5
 
-        self.database_url = database_url
-        self.engine = None
-        self.debug = debug
-        self.connect()
-
-        self.last_state: Dict[int, DirectorCell] = {}
-        self.state: Dict[int, Dict[str, Any]] = {}
-
-        # Use a once-initialized list to store updates, to avoid redundant allocations
-        self._cell_updates = []
+#: Postgres cuts identifiers off at 63 bytes, schema names among them
+MAX_GAME_ID_LENGTH = 63 - len('minesweeper_')
 
-        # Cache our queries, so we don't incur construction costs in the hot path
-        self._insert_observations_query: Optional[Query] = None
-        self._split_supersets_query: Optional[Query] = None
-        self._constrict_overlaps_query: Optional[Query] = None
-        self._baked_eager_moves_query: Optional[BakedQuery] = None
-        self._baked_act_lowest_observed_probability_query: Optional[BakedQuery] = None
-
-        # Use a bakery to avoid SQL generation costs
-        self.bakery = baked.bakery()
-
-    def connect(self):
-        self.engine = create_engine(self.database_url, echo='debug' if self.debug else False)
-        logging.getLogger('sqlalchemy.engine').propagate = False
-
-        # intarray makes set logic w/ arrays easier
-        self.engine.execute('CREATE EXTENSION IF NOT EXISTS intarray;')
-
-        self._sessionmaker = scoped_session(sessionmaker(bind=self.engine))
-
-        Model.metadata.drop_all(self.engine)
-        Model.metadata.create_all(self.engine)
-
-    def _get_cell_updates(self):
-        if not self.state:
-            self.state = {
-                game_cell.idx: {
-                    'idx': game_cell.idx,
-                    'x': game_cell.x,
-                    'y': game_cell.y,
-                    'number': game_cell.number,
-                    'is_revealed': game_cell.is_revealed(),
-                    'is_flagged': game_cell.is_flagged(),
-                }
-                for game_cell in self.control.get_dirty_cells()
-            }
-            self.last_state = {
-                game_cell.idx: game_cell.type
-                for game_cell in self.control.get_dirty_cells()
-            }
-            return self.state.values()
-
-        else:
-            self._cell_updates.clear()
-
-            for game_cell in self.control.get_dirty_cells():
-                if self.last_state.get(game_cell.idx) != game_cell.type:
-                    self.last_state[game_cell.idx] = game_cell.type
-
-                    cell_state = self.state[game_cell.idx]
-                    cell_state['number'] = game_cell.number
-                    cell_state['is_revealed'] = game_cell.is_revealed()
-                    cell_state['is_flagged'] = game_cell.is_flagged()
-
-                    self._cell_updates.append(cell_state)
-
-            return self._cell_updates
-
-    def update_cells(self):
-        mappings = self._get_cell_updates()
 
-        try:
-            self.session.bulk_update_mappings(Cell.__mapper__, mappings)
-        except StaleDataError:
-            self.session.rollback()
-
-            self.session.bulk_insert_mappings(Cell.__mapper__, mappings)
-            self.session.commit()
-
-            # Create our neighbour links using INSERT FROM SELECT
-            neighbor = aliased(Cell, name='neighbor')
-            st = insert(CellNeighbor)
-            st = st.from_select(
-                ['cell_idx', 'neighbor_idx'],
-                self.session
-                    .query(Cell.idx, neighbor.idx)
-                    .select_from(Cell)
-                    .join(neighbor, or_((Cell.x == neighbor.x + d_x) & (Cell.y == neighbor.y + d_y)
-                                        for d_x, d_y in DirectorCell.get_neighbor_deltas()))
-            )
-            self.engine.execute(st)
+@lru_cache(maxsize=None)
+def get_engine(database_url: str, debug: bool = False, pool_size: int = POOL_SIZE) -> Engine:
+    """Return the engine (and so connection pool) shared by all games on a database"""
+    engine = create_engine(database_url,
+                           echo='debug' if debug else False,
+                           pool_size=pool_size)
+    logging.getLogger('sqlalchemy.engine').propagate = False
+    event.listen(engine, 'connect', _configure_connection)
 
-        self.session.commit()
+    # intarray makes set logic w/ arrays easier
+    engine.execute('CREATE EXTENSION IF NOT EXISTS intarray;')
 
-    def exec_moves(self, moves):
-        """Execute moves in the form ('xyz_click', cell)"""
-        for move in moves:
-            self.exec_move(move)
+    return engine
 
-    def exec_move(self, move):
-        attr, cell = move
-        getattr(cell, attr)()
 
-    def act(self):
-        self.session: Session = self._sessionmaker()
+def _configure_connection(dbapi_connection, connection_record):
+    # Our tables are all scratch, so commits needn't wait on the disk
+    cursor = dbapi_connection.cursor()
+    cursor.execute('SET synchronous_commit TO off;')
+    cursor.close()
+    dbapi_connection.commit()
 
-        methods = [
-            self.act_deliberately,
-            self.act_lowest_observed_probability,
-            self.act_random,
-        ]
 
-        try:
-            self.update_cells()
-            for method in methods:
-                if method():
-                    logger.info('Acting with %s', method.__name__)
-                    break
-        finally:
-            self._sessionmaker.remove()
-
-    def act_deliberately(self):
-        # Clear table first
-        self.engine.execute(f'TRUNCATE {Observation.__tablename__};')
-        self.session.commit()
-
-        self.init_insights()
-        self.propagate_observations()
-
-        moves = self.choose_eager_moves()
-        if moves:
-            self.exec_moves(moves)
-            return True
-
-    def init_insights(self):
-        self.session.execute(self.get_insert_observations_query())
-        self.session.commit()
-
-    def get_insert_observations_query(self):
-        if self._insert_observations_query is None:
-            self._insert_observations_query = self._get_insert_observations_query()
-
-        return self._insert_observations_query
-
-    def _get_insert_observations_query(self):
-        cell = aliased(Cell, name='cell')
-        neighbor = aliased(Cell, name='neighbor')
-
-        # Grab all unrevealed neighbors of numbered cells, including flagged ones
-        # (there may be dupe neighbors, if a numbered cell shares neighbors with
-        #  another numbered cell).
-        st = self.session.query(
-            cell.idx.label('cell_idx'),
-            neighbor.idx.label('neighbor_idx'),
-            neighbor.is_flagged.label('is_flagged'),
-            cell.number.label('original_number'),
-            (func.count(neighbor.idx)
-                 .filter(neighbor.is_flagged)
-                 .over(cell.idx)).label('num_flagged_neighbors'),
-        )
-        st = st.select_from(CellNeighbor)
-        st = st.join(cell, CellNeighbor.cell_idx == cell.idx)
-        st = st.join(neighbor, CellNeighbor.neighbor_idx == neighbor.idx)
-        st = st.filter(
-            cell.number != None,
-            ~neighbor.is_revealed,
-        )
-        st = st.order_by(cell.idx)
-        raw_observations_data = st.subquery('raw_observations_data')
-
-        # Filter out our flagged neighbors, and add an index for each unique
-        # cell_idx, which will be used to correlate inserted Observations later
-        st = self.session.query(
-            func.dense_rank().over(order_by=raw_observations_data.c.cell_idx).label('observation_idx'),
-            raw_observations_data.c.cell_idx,
-            raw_observations_data.c.neighbor_idx,
-            (raw_observations_data.c.original_number - raw_observations_data.c.num_flagged_neighbors).label('num_flags_left'),
-        )
-        st = st.filter(
-            ~raw_observations_data.c.is_flagged,
-        )
-        st = st.order_by(
-            raw_observations_data.c.cell_idx
-        )
-        observations_data = st.cte('observations_data')
-
-        # Insert our observations
-        st = insert(Observation)
-        st = st.from_select(
-            (
-                Observation.cell_idx,
-                Observation.cells,
-                Observation.num_mines_remaining,
-            ),
-            self.session.query(
-                observations_data.c.cell_idx,
-                func.array_agg(observations_data.c.neighbor_idx),
-                observations_data.c.num_flags_left.label('num_mines_remaining'),
-            ).group_by(
-                observations_data.c.cell_idx,
-                observations_data.c.num_flags_left,
-            ).order_by(
-                # it's important this ordering matches observations_data's ordering
-                observations_data.c.cell_idx
-            ),
-        )
-        st = st.returning(Observation.id)
-        insert_observations = st
-
-        return insert_observations
-
-    def propagate_observations(self):
-        """Split observations into atomic chunks
-        """
-        self.split_supersets()
-        self.constrict_overlaps()
-
-    def split_supersets(self):
-        """Remove strict subets from their superset Observation
-        """
-        self.engine.execute(self.get_split_supersets_query())
-        self.session.commit()
-
-    def get_split_supersets_query(self):
-        if self._split_supersets_query is None:
-            self._split_supersets_query = self._get_split_supersets_query()
+@register_director('postgres')
+class PostgresDirector(SetLogicDirector):
+    """Use postgres for the heavy lifting
 
-        return self._split_supersets_query
+    Each game keeps its tables in its own schema, so many games may share one
+    database (and connection pool) at once. Unless a game_id is passed (or set
+    in MINESWEEPER_GAME_ID), each director makes up its own, and drops its
+    schema on close().
+    """
 
-    def _get_split_supersets_query(self):
-        superset = aliased(Observation, name='superset')
-        subset = aliased(Observation, name='subset')
+    COPY_CELL_UPDATES = (
+        'COPY {schema}.' + CellUpdate.__tablename__ + ' '
+        '(' + ', '.join(CELL_COLUMNS) + ') '
+        'FROM STDIN WITH (FORMAT csv)'
+    )
 
-        st = self.session.query(
-            superset.id.label('superset_id'),
-            superset.cells.label('superset_cells'),
-            superset.num_mines_remaining.label('superset_remaining'),
-            subset.cells.label('subset_cells'),
-            subset.num_mines_remaining.label('subset_remaining'),
-        )
-        st = st.select_from(superset, subset)
-        st = st.filter(
-            superset.id != subset.id,
-            superset.cells.contains(subset.cells),
-            superset.cells != subset.cells,
-        )
-        overlaps = st.subquery('overlaps')
+    # Statements run every step are prepared server-side, once per connection,
+    # and shared by every game: they're unqualified, and each step sets the
+    # search_path to its game's schema (which has postgres re-plan them)
+    PREPARED_STATEMENTS = {
+        'step': ('''
+            PREPARE {name} (boolean, integer, integer, integer, interval) AS
+            SELECT action, x, y
+            FROM minesweeper_step($1, $2, $3, $4, $5)
+        ''', '''
+            EXECUTE {name} (:first_load, :width, :height, :mines_left, :time_budget)
+        '''),
+        'random': ('''
+            PREPARE {name} AS
+            SELECT x, y
+            FROM cell
+            WHERE NOT is_revealed AND NOT is_flagged
+            ORDER BY random()
+        ''', '''
+            EXECUTE {name}
+        '''),
+    }
+
+    def __init__(self, *args, database_url=None, game_id=None, pool_size=None, debug=True,
+                 **kwargs):
+        super(PostgresDirector, self).__init__(*args, debug=debug, **kwargs)
 
-        st = update(Observation)
-        st = st.values(
-            cells=overlaps.c.superset_cells - overlaps.c.subset_cells,
-            num_mines_remaining=overlaps.c.superset_remaining - overlaps.c.subset_remaining,
-        )
-        st = st.where(Observation.id == overlaps.c.superset_id)
-        update_supersets = st
+        if database_url is None:
+            database_url = os.getenv('DATABASE_URL')
+        if game_id is None:
+            game_id = os.getenv('MINESWEEPER_GAME_ID')
+        # A made-up game's schema is of no use to anyone once it's over
+        self.drop_on_close = game_id is None
+        if game_id is None:
+            game_id = uuid.uuid4().hex
+        # Raw DDL leaves the schema unquoted, and so folded to lower case, while
+        # SQLAlchemy quotes (and so preserves) any upper case -- they must agree
+        game_id = game_id.lower()
+        if not re.match(r'^[a-z0-9_]+$', game_id):
+            raise ValueError(f'game_id may only contain letters, digits, and underscores; '
+                             f'got {game_id!r}')
+        if len(game_id) > MAX_GAME_ID_LENGTH:
+            raise ValueError(f'game_id may be at most {MAX_GAME_ID_LENGTH} characters long; '
+                             f'got {game_id!r}')
+        if pool_size is None:
+            pool_size = int(os.getenv('MINESWEEPER_DB_POOL_SIZE', POOL_SIZE))
 
-        return update_supersets
+        self.database_url = database_url
+        self.game_id = game_id
+        self.schema = f'minesweeper_{game_id}'
+        self.pool_size = pool_size
+        self.engine = None
+        self.debug = debug
+        self.connect()
 
-    def constrict_overlaps(self):
-        """Impose constraints by shrinking observation cells and mines remaining
+    def connect(self):
+        # Our models are unqualified, and land in this game's schema
+        self.engine = get_engine(self.database_url, self.debug, self.pool_size).execution_options(
+            schema_translate_map={None: self.schema})
+
+        self._prepared_statements = {
+            key: (
+                f'minesweeper_{key}',
+                prepare.format(name=f'minesweeper_{key}'),
+                text(execute.format(name=f'minesweeper_{key}')),
+            )
+            for key, (prepare, execute) in self.PREPARED_STATEMENTS.items()
+        }
+        self._copy_cell_updates = self.COPY_CELL_UPDATES.format(schema=self.schema)
+
+        version = get_schema_version()
+        with self.engine.begin() as connection:
+            installed = connection.execute(text('''
+                SELECT obj_description(oid, 'pg_namespace')
+                FROM pg_namespace
+                WHERE nspname = :schema
+            '''), schema=self.schema).scalar()
+
+            if installed == version:
+                logger.debug('Reusing schema %s', self.schema)
+            else:
+                self.build_schema(connection, version)
+
+        # A previous game may have left its rows behind
+        self.clear()
+
+    def build_schema(self, connection: Connection, version: str):
+        """(Re)create this game's schema, and everything in it, from scratch"""
+        logger.info('Building schema %s', self.schema)
+
+        # Anything left by other versions is scratch, too
+        connection.execute(f'DROP SCHEMA IF EXISTS {self.schema} CASCADE;')
+        connection.execute(f'CREATE SCHEMA {self.schema};')
+
+        # Raw DDL (the fillfactor, and our functions) is unqualified, too
+        connection.execute(f'SET LOCAL search_path TO {self.schema}, public;')
+        Model.metadata.create_all(connection)
+
+        for function in FUNCTIONS:
+            connection.execute(function)
+
+        connection.execute(f"COMMENT ON SCHEMA {self.schema} IS '{version}';")
+
+    def close(self):
+        if self.drop_on_close:
+            with self.engine.begin() as connection:
+                connection.execute(f'DROP SCHEMA IF EXISTS {self.schema} CASCADE;')
+
+    def clear(self):
+        """Delete this game's rows -- and no others'"""
+        tables = ', '.join(f'{self.schema}.{table.name}'
+                           for table in Model.metadata.sorted_tables)
+        with self.engine.begin() as connection:
+            connection.execute(f'TRUNCATE {tables};')
+
+    def reset(self):
+        self.clear()
+        super(PostgresDirector, self).reset()
+
+    def execute_prepared(self, connection: Connection, key: str, params: dict = None):
+        """Execute one of PREPARED_STATEMENTS, preparing it first if need be
+
+        Prepared statements outlive transactions, so the connection remembers
+        (for as long as the pool keeps it open) which it has already. The
+        search_path must already lead to this game's schema.
         """
-        self.engine.execute(self.get_constrict_overlaps_query())
-        self.session.commit()
-
-    def get_constrict_overlaps_query(self):
-        if self._constrict_overlaps_query is None:
-            self._constrict_overlaps_query = self._get_constrict_overlaps_query()
-
-        return self._constrict_overlaps_query
-
-    def _get_constrict_overlaps_query(self):
-        constrictor = aliased(Observation, name='constrictor')
-        constricted = aliased(Observation, name='constricted')
-
-        st = self.session.query(
-            constrictor.cells.label('constrictor_cells'),
-            constrictor.num_mines_remaining.label('constrictor_remaining'),
-            constricted.id.label('constricted_id'),
-            constricted.cells.label('constricted_cells'),
-            constricted.num_mines_remaining.label('constricted_remaining'),
-        )
-        st = st.select_from(constrictor, constricted)
-        st = st.filter(
-            constrictor.id != constricted.id,
-            constrictor.cells.overlap(constricted.cells),
-            constrictor.cells != constricted.cells,
-            constrictor.num_mines_remaining == 1,  # TODO: generalize this
-            constricted.num_mines_remaining > constrictor.num_mines_remaining,
-        )
-        constrictions = st.subquery('constrictions')
-
-        st = update(Observation)
-        st = st.values(
-            cells=constrictions.c.constricted_cells - constrictions.c.constrictor_cells,
-            num_mines_remaining=constrictions.c.constricted_remaining - constrictions.c.constrictor_remaining,
-        )
-        st = st.where(Observation.id == constrictions.c.constricted_id)
-        update_constricted = st
-
-        return update_constricted
+        name, prepare, execute = self._prepared_statements[key]
+
+        prepared = connection.info.setdefault('prepared_statements', set())
+        if name not in prepared:
+            connection.execute(prepare)
+            prepared.add(name)
+
+        return connection.execute(execute, params or {})
+
+    def step(self, mappings, deadline: Deadline):
+        width, height = self.control.get_board_size()
+        time_budget = deadline.timeout()
+
+        # One connection, and one transaction, for the whole step
+        with self.engine.begin() as connection:
+            connection.execute(f'SET LOCAL search_path TO {self.schema}, public;')
+            self.copy_cell_updates(connection, mappings)
+
+            result = self.execute_prepared(connection, 'step', {
+                'first_load': not self._is_loaded,
+                'width': width,
+                'height': height,
+                'mines_left': self.control.get_mines_left(),
+                'time_budget': None if time_budget is None else timedelta(seconds=time_budget),
+            })
+            moves = [
+                (action, self.control.get_cell(x, y))
+                for action, x, y in result
+            ]
+
+            if moves:
+                logger.info('Acting on %d moves from the database', len(moves))
+            else:
+                logger.info('Acting with choose_random_moves')
+                moves = self.choose_random_moves(connection)
+
+        return moves
+
+    def copy_cell_updates(self, connection: Connection, mappings):
+        """Stream cell changes into the staging table, with a single COPY"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # None is written empty, which COPY reads as NULL
+        writer.writerows(iter_cell_rows(mappings))
+        buffer.seek(0)
+
+        # COPY must go through the DBAPI connection itself; it's the same one,
+        # so it shares a transaction with the step reading it
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(self._copy_cell_updates, buffer)
+        finally:
+            cursor.close()
 
-    def choose_eager_moves(self):
-        # XXX: using the cached version of the query ends up freezing the app. idk why
-        eager_moves = self.get_eager_moves_query()
-        return [
-            (action, self.control.get_cell(x, y))
-            for action, x, y in eager_moves
+    def choose_random_moves(self, connection: Connection):
+        """Click any unrevealed cell, marking the others to inform the viewer"""
+        cells = [
+            self.control.get_cell(x, y)
+            for x, y in self.execute_prepared(connection, 'random')
         ]
+        if not cells:
+            return []
 
-    def get_eager_moves_query(self):
-        if self._baked_eager_moves_query is None:
-            self._baked_eager_moves_query = self.bakery(self._get_eager_moves_query)
-
-        return self._baked_eager_moves_query.for_session(self.session)
-
-    def _get_eager_moves_query(self, session):
-        # REVELATIONS ---
-        # Any time num_mines_remaining is 0, we know it would be impossible to
-        # have a mine in the cell. So, uh, click it.
-        st = session.query(
-            func.unnest(Observation.cells).label('cell_idx')
-        )
-        st = st.select_from(Observation)
-        st = st.filter(Observation.num_mines_remaining == 0)
-        revelation_cells = st.cte('revelation_cells')
-
-        st = session.query(
-            literal('click'),
-            Cell.x,
-            Cell.y,
-        )
-        st = st.select_from(revelation_cells)
-        st = st.join(Cell, revelation_cells.c.cell_idx == Cell.idx)
-        st = st.filter(Observation.num_mines_remaining == 0)
-        to_reveal = st
-
-        # FLAGELLATIONS ---
-        # First, grab the number of cells in each observation, which must occur
-        # in a CTE
-        st = session.query(
-            func.unnest(Observation.cells).label('cell_idx')
-        )
-        st = st.select_from(Observation)
-        st = st.filter(Observation.num_mines_remaining == func.cardinality(Observation.cells))
-        flagellation_cells = st.subquery('flagellation_cells')
-
-        # Now, any time num_mines_remaining of an observation are the same as
-        # the number of cells it references, we are certain all those cells have
-        # mines. So, uh, right click em.
-        st = session.query(
-            literal('right_click'),
-            Cell.x,
-            Cell.y,
-        )
-        st = st.select_from(flagellation_cells)
-        st = st.join(Cell, flagellation_cells.c.cell_idx == Cell.idx)
-        to_flag = st
-
-        eager_moves = to_reveal.union(to_flag)
-        return eager_moves
-
-    def act_lowest_observed_probability(self):
-        """Choose an unrevealed cell with the lowest probability of being a mine
-        """
-        choices = self.get_act_lowest_observed_probability_query().all()
-        if not choices:
-            return False
-
-        choice, *others = choices
-
-        st = self.session.query(func.count(Cell.idx))
-        st = st.filter_by(is_revealed=False, is_flagged=False)
-        total_unrevealed_count = st.scalar()
-
-        base_probability = self.control.get_mines_left() / total_unrevealed_count
-
-        # Only act if lowest observed probability is less than the probability
-        # of hitting a mine when selecting *any* cell at random
-        if choice.probability >= base_probability:
-            return False
-
-        game_cell = self.control.get_cell(choice.x, choice.y)
-        game_cell.click()
-
-        # Mark the other choices, to inform viewer
-        for cell in others:
-            game_cell = self.control.get_cell(cell.x, cell.y)
-            game_cell.mark1()
-
-        return True
-
-    def get_act_lowest_observed_probability_query(self):
-        if self._baked_act_lowest_observed_probability_query is None:
-            self._baked_act_lowest_observed_probability_query = (
-                self.bakery(self._get_act_lowest_observed_probability_query)
-            )
-
-        return self._baked_act_lowest_observed_probability_query.for_session(self.session)
-
-    def _get_act_lowest_observed_probability_query(self, session):
-        num_mines_remaining = cast(Observation.num_mines_remaining, DOUBLE_PRECISION)
-
-        st = session.query(
-            (num_mines_remaining / func.cardinality(Observation.cells)).label('probability'),
-            func.unnest(Observation.cells).label('cell_idx')
-        )
-        st = st.filter(func.cardinality(Observation.cells) > 0)
-        raw_cell_probabilities = st.subquery('raw_cell_probabilities')
-
-        st = session.query(
-            func.max(raw_cell_probabilities.c.probability).label('probability'),
-            raw_cell_probabilities.c.cell_idx,
-        )
-        st = st.group_by(raw_cell_probabilities.c.cell_idx)
-        cell_probabilities = st.subquery('cell_probabilities')
-
-        st = session.query(
-            Cell.x,
-            Cell.y,
-            cell_probabilities.c.probability,
-        )
-        st = st.select_from(cell_probabilities)
-        st = st.join(Cell, Cell.idx == cell_probabilities.c.cell_idx)
-        st = st.order_by(cell_probabilities.c.probability)
-        choices = st
-
-        return choices
-
-    def act_random(self):
-        qs = self.session.query(Cell)
-        qs = qs.filter_by(is_revealed=False, is_flagged=False)
-        qs = qs.order_by(func.random())
-
-        random_cell = qs.first()
-        game_cell = self.control.get_cell(random_cell.x, random_cell.y)
-        game_cell.click()
-
-        # Mark the other choices, to inform viewer
-        for x, y in qs.with_entities(Cell.x, Cell.y)[1:]:
-            game_cell = self.control.get_cell(x, y)
-            game_cell.mark1()
-
-        return True
+        random_cell, *others = cells
+        return [('click', random_cell)] + [('mark1', cell) for cell in others]
@@ -3,11 +3,11 @@ from __future__ import absolute_import
 from random import SystemRandom
 random = SystemRandom()
 
-from minesweeper.director.base import Director
+from minesweeper.director.base import Deadline, Director
 
 
 class RandomDirector(Director):
-    def act(self):
+    def act(self, deadline: Deadline = None):
         cells = self.control.get_cells()
         unrevealed = [c for c in cells if c.is_unrevealed()]
         random.shuffle(unrevealed)
@@ -19,7 +19,7 @@ class RandomExpansionDirector(RandomDirector):
     def click_random(self):
         super(RandomExpansionDirector, self).act()
 
-    def act(self):
+    def act(self, deadline: Deadline = None):
         cells = self.control.get_cells()
         revealed = [c for c in cells if c.is_revealed()]
         if not revealed:
@@ -0,0 +1,109 @@
+"""
+Shared plumbing of directors which deduce with set logic inside a database.
+
+The board is mirrored into a cell table, sending only the cells which changed
+each step. Each numbered cell observes how many mines lie among the unrevealed
+cells around it; observations are split and intersected with one another until
+nothing more is learned, and whatever they make certain is acted upon.
+
+Only the database differs between backends, so nothing here depends on one.
+"""
+from typing import Any, Dict, Iterable, List, Tuple
+
+from minesweeper.director.base import (
+    Cell as DirectorCell,
+    Deadline,
+    Director,
+)
+
+#: The columns of a cell sent to the database, in order
+CELL_COLUMNS = ('idx', 'x', 'y', 'number', 'is_revealed', 'is_flagged')
+
+
+def iter_cell_rows(mappings: Iterable[Dict[str, Any]]) -> Iterable[Tuple]:
+    """Cell states as tuples of CELL_COLUMNS"""
+    for mapping in mappings:
+        yield tuple(mapping[column] for column in CELL_COLUMNS)
+
+
+class SetLogicDirector(Director):
+    """Mirror the board into a database, and act on the moves it deduces
+
+    Subclasses implement step(), which receives the changed cells and returns
+    moves in the form ('xyz_click', cell).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SetLogicDirector, self).__init__(*args, **kwargs)
+
+        self.last_state: Dict[int, DirectorCell] = {}
+        self.state: Dict[int, Dict[str, Any]] = {}
+
+        # Use a once-initialized list to store updates, to avoid redundant allocations
+        self._cell_updates = []
+
+        # Whether the database has every cell, after which only changes are sent
+        self._is_loaded = False
+
+    def reset(self):
+        self.last_state.clear()
+        self.state.clear()
+        self._is_loaded = False
+
+    def _get_cell_updates(self):
+        if not self._is_loaded:
+            self.state = {
+                game_cell.idx: {
+                    'idx': game_cell.idx,
+                    'x': game_cell.x,
+                    'y': game_cell.y,
+                    'number': game_cell.number,
+                    'is_revealed': game_cell.is_revealed(),
+                    'is_flagged': game_cell.is_flagged(),
+                }
+                for game_cell in self.control.get_cells()
+            }
+            self.last_state = {
+                game_cell.idx: game_cell.type
+                for game_cell in self.control.get_cells()
+            }
+            return self.state.values()
+
+        else:
+            self._cell_updates.clear()
+
+            for game_cell in self.control.get_dirty_cells():
+                if self.last_state.get(game_cell.idx) != game_cell.type:
+                    self.last_state[game_cell.idx] = game_cell.type
+
+                    cell_state = self.state[game_cell.idx]
+                    cell_state['number'] = game_cell.number
+                    cell_state['is_revealed'] = game_cell.is_revealed()
+                    cell_state['is_flagged'] = game_cell.is_flagged()
+
+                    self._cell_updates.append(cell_state)
+
+            return self._cell_updates
+
+    def step(self, mappings: Iterable[Dict[str, Any]], deadline: Deadline) -> List[tuple]:
+        """Send changed cells to the database, and receive the moves to make
+
+        On the first step (while not yet loaded), mappings hold every cell.
+        """
+        raise NotImplementedError
+
+    def exec_moves(self, moves):
+        """Execute moves in the form ('xyz_click', cell)"""
+        for move in moves:
+            self.exec_move(move)
+
+    def exec_move(self, move):
+        attr, cell = move
+        getattr(cell, attr)()
+
+    def act(self, deadline: Deadline = None):
+        deadline = deadline or Deadline()
+
+        moves = self.step(self._get_cell_updates(), deadline)
+        self._is_loaded = True
+        self.exec_moves(moves)
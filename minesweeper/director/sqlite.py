@@ -0,0 +1,482 @@
+"""
+The set-logic director, on an in-process SQLite database.
+
+SQLite has no arrays, so each observation's cells are rows of a normalized
+observation_cell table, and the set operations intarray provides in postgres
+become joins on it: an observation is a subset of another if all its cells
+join to the other's, and two overlap by the number of their cells which join.
+
+There's no server, and each game has a database of its own (in memory, by
+default), so games may be played in as many processes as there are cores.
+"""
+import logging
+import sqlite3
+from typing import List
+
+from minesweeper.director.base import (
+    Cell as DirectorCell,
+    Deadline,
+    register_director,
+)
+from minesweeper.director.set_logic import CELL_COLUMNS, iter_cell_rows, SetLogicDirector
+
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = '''
+CREATE TABLE cell (
+    idx INTEGER PRIMARY KEY,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    number INTEGER,
+    is_revealed BOOLEAN NOT NULL,
+    is_flagged BOOLEAN NOT NULL
+);
+
+CREATE TABLE cell_neighbor (
+    cell_idx INTEGER NOT NULL,
+    neighbor_idx INTEGER NOT NULL,
+    PRIMARY KEY (cell_idx, neighbor_idx)
+) WITHOUT ROWID;
+CREATE INDEX cell_neighbor_reverse_lookup ON cell_neighbor (neighbor_idx, cell_idx);
+
+-- cell_idx is the numbered cell an observation was derived from; size the
+-- number of its cells, kept so subsets and overlaps needn't count them
+CREATE TABLE observation (
+    id INTEGER PRIMARY KEY,
+    cell_idx INTEGER NOT NULL,
+    num_mines_remaining INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX observation_source_lookup ON observation (cell_idx);
+
+CREATE TABLE observation_cell (
+    observation_id INTEGER NOT NULL,
+    cell_idx INTEGER NOT NULL,
+    PRIMARY KEY (observation_id, cell_idx)
+) WITHOUT ROWID;
+CREATE INDEX observation_cell_lookup ON observation_cell (cell_idx, observation_id);
+
+-- Scratch space for each step
+CREATE TEMP TABLE dirty (idx INTEGER PRIMARY KEY);
+CREATE TEMP TABLE source (idx INTEGER PRIMARY KEY);
+CREATE TEMP TABLE duplicate (
+    id INTEGER PRIMARY KEY,
+    original_id INTEGER NOT NULL
+);
+CREATE TEMP TABLE split (
+    superset_id INTEGER PRIMARY KEY,
+    subset_id INTEGER NOT NULL,
+    subset_remaining INTEGER NOT NULL,
+    subset_size INTEGER NOT NULL
+);
+CREATE TEMP TABLE split_cell (
+    observation_id INTEGER NOT NULL,
+    cell_idx INTEGER NOT NULL,
+    PRIMARY KEY (observation_id, cell_idx)
+) WITHOUT ROWID;
+CREATE TEMP TABLE pinned (
+    id INTEGER PRIMARY KEY,
+    cell_idx INTEGER NOT NULL,
+    first_id INTEGER NOT NULL,
+    second_id INTEGER NOT NULL,
+    num_mines_remaining INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+'''
+
+
+@register_director('sqlite')
+class SqliteDirector(SetLogicDirector):
+    """Use SQLite for the heavy lifting, in-process
+
+    Works as PostgresDirector does, step for step -- see its functions for the
+    reasoning behind each.
+    """
+
+    #: Passes of propagation to make, at most, in one step
+    MAX_PASSES = 64
+
+    def __init__(self, *args, database=':memory:', **kwargs):
+        super(SqliteDirector, self).__init__(*args, **kwargs)
+
+        self.database = database
+        self._db = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        """The connection, opened on first use -- by the thread acting
+
+        The game constructs and resets its director on one thread, and has it
+        act on another, so nothing but act() may query the database.
+        """
+        if self._db is None:
+            self._db = self.connect()
+        return self._db
+
+    def connect(self) -> sqlite3.Connection:
+        # Everything can be rebuilt from the board, so nothing is journaled
+        # (and each statement commits as it goes). Only the acting thread uses
+        # the connection, but it's closed once that thread is done, by another.
+        db = sqlite3.connect(self.database, isolation_level=None, check_same_thread=False)
+        db.execute('PRAGMA journal_mode = OFF')
+        db.execute('PRAGMA synchronous = OFF')
+        db.executescript(SCHEMA)
+        return db
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def step(self, mappings, deadline: Deadline):
+        if self._is_loaded:
+            self.update_cells(mappings)
+        else:
+            self.load_cells(mappings)
+
+        if deadline.expired():
+            logger.info('Out of time before propagate_observations')
+        else:
+            self.propagate_observations(deadline)
+
+        moves = self.choose_eager_moves()
+        if moves:
+            logger.info('Acting on %d moves from the database', len(moves))
+            return moves
+
+        moves = self.choose_lowest_probability_moves()
+        if moves:
+            logger.info('Acting on the lowest observed probability')
+            return moves
+
+        logger.info('Acting with choose_random_moves')
+        return self.choose_random_moves()
+
+    def load_cells(self, mappings):
+        # This empties every table, too, so reset() needn't (and, being called
+        # on a thread other than the one acting, mustn't) touch the database
+        placeholders = ', '.join('?' * len(CELL_COLUMNS))
+        self.db.execute('DELETE FROM cell')
+        self.db.executemany(f'INSERT INTO cell ({", ".join(CELL_COLUMNS)}) VALUES ({placeholders})',
+                            iter_cell_rows(mappings))
+
+        # Neighbours' idx are worked out from their coords, as idx = x * height + y
+        width, height = self.control.get_board_size()
+        deltas = ', '.join(f'({d_x}, {d_y})' for d_x, d_y in DirectorCell.get_neighbor_deltas())
+        self.db.execute('DELETE FROM cell_neighbor')
+        self.db.execute(f'''
+            WITH delta (x, y) AS (VALUES {deltas})
+            INSERT INTO cell_neighbor (cell_idx, neighbor_idx)
+            SELECT cell.idx, (cell.x + delta.x) * :height + (cell.y + delta.y)
+            FROM cell, delta
+            WHERE cell.x + delta.x BETWEEN 0 AND :width - 1
+              AND cell.y + delta.y BETWEEN 0 AND :height - 1
+        ''', {'width': width, 'height': height})
+
+        self.db.execute('DELETE FROM observation')
+        self.db.execute('DELETE FROM observation_cell')
+        self.observe(restrict_sources=False)
+
+    def update_cells(self, mappings):
+        """Apply changed cells, and rebuild only the observations they bear upon"""
+        mappings = list(mappings)
+        if not mappings:
+            return
+
+        self.db.executemany('''
+            UPDATE cell
+            SET number = :number, is_revealed = :is_revealed, is_flagged = :is_flagged
+            WHERE idx = :idx
+        ''', mappings)
+
+        self.db.execute('DELETE FROM dirty')
+        self.db.executemany('INSERT INTO dirty (idx) VALUES (?)',
+                            ((mapping['idx'],) for mapping in mappings))
+
+        # The changed cells, the cells around them, and the sources of any
+        # observation including a changed cell all observe anew
+        self.db.executescript('''
+            DELETE FROM source;
+            INSERT OR IGNORE INTO source (idx)
+            SELECT idx FROM dirty;
+            INSERT OR IGNORE INTO source (idx)
+            SELECT cell_neighbor.cell_idx
+            FROM dirty
+            JOIN cell_neighbor ON cell_neighbor.neighbor_idx = dirty.idx;
+            INSERT OR IGNORE INTO source (idx)
+            SELECT observation.cell_idx
+            FROM dirty
+            JOIN observation_cell ON observation_cell.cell_idx = dirty.idx
+            JOIN observation ON observation.id = observation_cell.observation_id;
+
+            DELETE FROM observation_cell
+            WHERE observation_id IN (
+                SELECT observation.id
+                FROM source
+                JOIN observation ON observation.cell_idx = source.idx
+            );
+            DELETE FROM observation
+            WHERE cell_idx IN (SELECT idx FROM source);
+        ''')
+        self.observe(restrict_sources=True)
+
+    def observe(self, restrict_sources: bool):
+        """Insert observations of numbered cells (only those in source, if restricted)"""
+        first_id, = self.db.execute('SELECT coalesce(max(id), 0) + 1 FROM observation').fetchone()
+
+        self.db.execute(f'''
+            INSERT INTO observation (cell_idx, num_mines_remaining, size)
+            SELECT cell.idx,
+                   cell.number - sum(neighbor.is_flagged),
+                   sum(NOT neighbor.is_flagged)
+            FROM cell
+            JOIN cell_neighbor ON cell_neighbor.cell_idx = cell.idx
+            JOIN cell AS neighbor ON neighbor.idx = cell_neighbor.neighbor_idx
+            WHERE cell.number IS NOT NULL
+              AND NOT neighbor.is_revealed
+              {'AND cell.idx IN (SELECT idx FROM source)' if restrict_sources else ''}
+            GROUP BY cell.idx
+            HAVING sum(NOT neighbor.is_flagged) > 0
+        ''')
+        self.db.execute('''
+            INSERT INTO observation_cell (observation_id, cell_idx)
+            SELECT observation.id, neighbor.idx
+            FROM observation
+            JOIN cell_neighbor ON cell_neighbor.cell_idx = observation.cell_idx
+            JOIN cell AS neighbor ON neighbor.idx = cell_neighbor.neighbor_idx
+            WHERE observation.id >= ?
+              AND NOT neighbor.is_revealed
+              AND NOT neighbor.is_flagged
+        ''', (first_id,))
+
+    def propagate_observations(self, deadline: Deadline):
+        """Split and intersect observations, until nothing more is learned"""
+        for num_passes in range(1, self.MAX_PASSES + 1):
+            num_split = self.split_supersets()
+            num_pinned = self.pin_overlaps()
+            if not num_split and not num_pinned:
+                break
+            if deadline.expired():
+                logger.info('Out of time during propagate_observations')
+                break
+
+        logger.debug('Propagated observations in %d passes', num_passes)
+
+    def split_supersets(self) -> int:
+        """Remove strict subsets from their supersets -- the largest, for each
+
+        Returns the number of supersets split.
+        """
+        # Subsets' cells and mines are copied aside first, as any of them may be
+        # a superset being split, too
+        self.db.executescript('''
+            DELETE FROM split;
+            INSERT INTO split (superset_id, subset_id, subset_remaining, subset_size)
+            SELECT superset_id, subset_id, subset_remaining, subset_size
+            FROM (
+                SELECT superset.id AS superset_id,
+                       subset.id AS subset_id,
+                       subset.num_mines_remaining AS subset_remaining,
+                       subset.size AS subset_size,
+                       row_number() OVER (
+                           PARTITION BY superset.id
+                           ORDER BY subset.size DESC, subset.id
+                       ) AS preference
+                FROM observation_cell AS subset_cell
+                JOIN observation_cell AS superset_cell
+                  ON superset_cell.cell_idx = subset_cell.cell_idx
+                 AND superset_cell.observation_id <> subset_cell.observation_id
+                JOIN observation AS subset ON subset.id = subset_cell.observation_id
+                JOIN observation AS superset ON superset.id = superset_cell.observation_id
+                WHERE subset.size < superset.size
+                GROUP BY superset.id, subset.id
+                HAVING count(*) = subset.size
+            )
+            WHERE preference = 1;
+
+            DELETE FROM split_cell;
+            INSERT INTO split_cell (observation_id, cell_idx)
+            SELECT split.superset_id, observation_cell.cell_idx
+            FROM split
+            JOIN observation_cell ON observation_cell.observation_id = split.subset_id;
+
+            UPDATE observation
+            SET num_mines_remaining = num_mines_remaining - (
+                    SELECT subset_remaining FROM split WHERE superset_id = observation.id),
+                size = size - (
+                    SELECT subset_size FROM split WHERE superset_id = observation.id)
+            WHERE id IN (SELECT superset_id FROM split);
+
+            DELETE FROM observation_cell
+            WHERE (observation_id, cell_idx) IN (SELECT observation_id, cell_idx FROM split_cell);
+        ''')
+        num_split, = self.db.execute('SELECT count(*) FROM split').fetchone()
+        return num_split
+
+    def pin_overlaps(self) -> int:
+        """Observe the cells shared by two observations, when their mines are certain
+
+        Returns the number of new observations made.
+        """
+        first_id, = self.db.execute('SELECT coalesce(max(id), 0) + 1 FROM observation').fetchone()
+
+        self.db.executescript(f'''
+            DELETE FROM pinned;
+            INSERT INTO pinned (id, cell_idx, first_id, second_id, num_mines_remaining, size)
+            SELECT {first_id} - 1 + row_number() OVER (ORDER BY first_id, second_id),
+                   cell_idx, first_id, second_id, lowest, shared_size
+            FROM (
+                SELECT first.cell_idx,
+                       first.id AS first_id,
+                       second.id AS second_id,
+                       shared.size AS shared_size,
+                       max(0,
+                           first.num_mines_remaining - (first.size - shared.size),
+                           second.num_mines_remaining - (second.size - shared.size)) AS lowest,
+                       min(shared.size,
+                           first.num_mines_remaining,
+                           second.num_mines_remaining) AS highest
+                FROM (
+                    SELECT first_cell.observation_id AS first_id,
+                           second_cell.observation_id AS second_id,
+                           count(*) AS size
+                    FROM observation_cell AS first_cell
+                    JOIN observation_cell AS second_cell
+                      ON second_cell.cell_idx = first_cell.cell_idx
+                     AND second_cell.observation_id > first_cell.observation_id
+                    GROUP BY first_cell.observation_id, second_cell.observation_id
+                ) AS shared
+                JOIN observation AS first ON first.id = shared.first_id
+                JOIN observation AS second ON second.id = shared.second_id
+                -- containment is left to the split
+                WHERE shared.size < first.size
+                  AND shared.size < second.size
+            )
+            WHERE lowest = highest;
+
+            INSERT INTO observation (id, cell_idx, num_mines_remaining, size)
+            SELECT id, cell_idx, num_mines_remaining, size
+            FROM pinned;
+
+            INSERT INTO observation_cell (observation_id, cell_idx)
+            SELECT pinned.id, first_cell.cell_idx
+            FROM pinned
+            JOIN observation_cell AS first_cell ON first_cell.observation_id = pinned.first_id
+            JOIN observation_cell AS second_cell
+              ON second_cell.observation_id = pinned.second_id
+             AND second_cell.cell_idx = first_cell.cell_idx;
+        ''')
+        self.delete_duplicate_observations()
+
+        num_pinned, = self.db.execute('SELECT count(*) FROM observation WHERE id >= ?',
+                                      (first_id,)).fetchone()
+        return num_pinned
+
+    def delete_duplicate_observations(self):
+        """Of observations with exactly the same cells, keep only the first
+
+        Should their mines differ, the board contradicts itself (a flag the
+        player placed must be wrong), and none of them are kept.
+        """
+        self.db.executescript('''
+            DELETE FROM duplicate;
+            INSERT INTO duplicate (id, original_id)
+            SELECT duplicate_id, min(original_id)
+            FROM (
+                SELECT later.id AS duplicate_id, earlier.id AS original_id
+                FROM observation_cell AS earlier_cell
+                JOIN observation_cell AS later_cell
+                  ON later_cell.cell_idx = earlier_cell.cell_idx
+                 AND later_cell.observation_id > earlier_cell.observation_id
+                JOIN observation AS earlier ON earlier.id = earlier_cell.observation_id
+                JOIN observation AS later ON later.id = later_cell.observation_id
+                WHERE later.size = earlier.size
+                GROUP BY earlier.id, later.id
+                HAVING count(*) = earlier.size
+            )
+            GROUP BY duplicate_id;
+        ''')
+
+        contradicted = self.db.execute('''
+            SELECT DISTINCT duplicate.original_id
+            FROM duplicate
+            JOIN observation AS original ON original.id = duplicate.original_id
+            JOIN observation ON observation.id = duplicate.id
+            WHERE observation.num_mines_remaining <> original.num_mines_remaining
+        ''').fetchall()
+        if contradicted:
+            logger.warning('Observations of %d sets of cells disagree on their mines; '
+                           'discarding them', len(contradicted))
+            self.db.executemany('''
+                INSERT OR IGNORE INTO duplicate (id, original_id) VALUES (?1, ?1)
+            ''', contradicted)
+
+        self.db.executescript('''
+            DELETE FROM observation_cell WHERE observation_id IN (SELECT id FROM duplicate);
+            DELETE FROM observation WHERE id IN (SELECT id FROM duplicate);
+        ''')
+
+    def choose_eager_moves(self) -> List[tuple]:
+        """Click every cell certainly safe, and flag every one certainly a mine"""
+        return [
+            (action, self.control.get_cell(x, y))
+            for action, x, y in self.db.execute('''
+                SELECT DISTINCT
+                       CASE WHEN observation.num_mines_remaining = 0
+                            THEN 'click' ELSE 'right_click' END,
+                       cell.x,
+                       cell.y
+                FROM observation
+                JOIN observation_cell ON observation_cell.observation_id = observation.id
+                JOIN cell ON cell.idx = observation_cell.cell_idx
+                WHERE observation.num_mines_remaining = 0
+                   OR observation.num_mines_remaining = observation.size
+            ''')
+        ]
+
+    def choose_lowest_probability_moves(self) -> List[tuple]:
+        """Click the cell least likely to be a mine, marking the other candidates
+
+        Only if that beats clicking any unrevealed cell at random.
+        """
+        num_unrevealed, = self.db.execute('''
+            SELECT count(*) FROM cell WHERE NOT is_revealed AND NOT is_flagged
+        ''').fetchone()
+        base_probability = self.control.get_mines_left() / max(num_unrevealed, 1)
+
+        choices = self.db.execute('''
+            SELECT cell.x,
+                   cell.y,
+                   max(CAST(observation.num_mines_remaining AS REAL) / observation.size)
+                       AS probability
+            FROM observation
+            JOIN observation_cell ON observation_cell.observation_id = observation.id
+            JOIN cell ON cell.idx = observation_cell.cell_idx
+            GROUP BY cell.idx
+            ORDER BY probability
+        ''').fetchall()
+        if not choices or choices[0][2] >= base_probability:
+            return []
+
+        (x, y, _), *others = choices
+        return [('click', self.control.get_cell(x, y))] + [
+            ('mark1', self.control.get_cell(x, y))
+            for x, y, _ in others
+        ]
+
+    def choose_random_moves(self) -> List[tuple]:
+        """Click any unrevealed cell, marking the others to inform the viewer"""
+        cells = [
+            self.control.get_cell(x, y)
+            for x, y in self.db.execute('''
+                SELECT x, y FROM cell
+                WHERE NOT is_revealed AND NOT is_flagged
+                ORDER BY random()
+            ''')
+        ]
+        if not cells:
+            return []
+
+        random_cell, *others = cells
+        return [('click', random_cell)] + [('mark1', cell) for cell in others]
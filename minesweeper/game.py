@@ -10,7 +10,7 @@ random = SystemRandom()
 import pygame
 _pygame_initialized = False
 
-from minesweeper.director.base import BaseControl, Cell as DirectorCell
+from minesweeper.director.base import BaseControl, Cell as DirectorCell, Deadline
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +52,10 @@ BG_COLOR = (220, 220, 220)
 # Number of frames to skip in between director actions
 DIRECTOR_SKIP_FRAMES = 0
 
+# Seconds a director may think before it must act on the best moves it has
+# (None for no limit)
+DIRECTOR_TIME_BUDGET = None
+
 
 class Sprites(object):
     _sprite_names = {
@@ -333,6 +337,8 @@ class GameControl(BaseControl):
             cell.type = self._get_cell_type(raw_cell)
             self._dirty_cells.append(cell)
 
+        self.invalidate_neighbor_stats(self._dirty_cells)
+
     def _get_cell_err(self, x, y):
         cell = self._get_raw_cell(x, y)
         if cell is None:
@@ -416,6 +422,9 @@ class QueuedControl(BaseControl):
             cell._control = self
         return cells
 
+    def get_neighbor_stats(self, cell):
+        return self._control.get_neighbor_stats(cell)
+
     def get_dirty_cells(self):
         cells = self._control.get_dirty_cells()
         for cell in cells:
@@ -494,6 +503,7 @@ class Game(object):
         self.director = None
         self.director_control = None
         self.director_skip_frames = None
+        self.director_time_budget = None
         self.director_act_at = None
         self.director_cell_redraw = None
         self.director_act_evt = threading.Event()
@@ -552,6 +562,7 @@ class Game(object):
 
     def init_vars(self):
         self.director_skip_frames = DIRECTOR_SKIP_FRAMES
+        self.director_time_budget = DIRECTOR_TIME_BUDGET
 
     def init_pygame(self):
         global _pygame_initialized
@@ -928,6 +939,8 @@ class Game(object):
             self.halt = True
             self.director_act_evt.set()
             self.director_thread.join()
+            if self.director:
+                self.director.close()
 
     def mainloop(self):
         dirty_rects = []
@@ -1048,7 +1061,7 @@ class Game(object):
 
             with self.director_act_lock:
                 self.director_act_evt.clear()
-                self.director.act()
+                self.director.act(deadline=Deadline.after(self.director_time_budget))
                 self.dirty_cells[:] = []
 
     def reconfigure_board(self, cell):
@@ -0,0 +1,169 @@
+"""
+Deduction by linear algebra over a system's constraints.
+
+Every constraint (mask, mines) reads as an equation: the cells of mask, each 0
+or 1, sum to mines. Eliminating variables between equations exposes cells
+which can only be one value, even where no constraint is a subset of another.
+
+Rows are sparse -- dicts of {cell bit: coefficient} -- as each constraint spans
+at most eight cells, and all arithmetic is on ints, so nothing is lost to
+rounding.
+"""
+from math import gcd
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from minesweeper.probability import Constraint
+from minesweeper.util import iter_bits
+
+
+#: A linear equation: ({cell bit: coefficient}, right-hand side)
+Row = Tuple[Dict[int, int], int]
+
+
+class Inconsistent(ValueError):
+    """The constraints admit no assignment of mines"""
+
+
+def normalize(coeffs: Dict[int, int], rhs: int) -> Row:
+    """Divide out any common factor, leaving the lowest bit's coefficient positive
+
+    >>> normalize({3: -4, 1: -2}, -6)
+    ({1: 1, 3: 2}, 3)
+    """
+    divisor = rhs
+    for coeff in coeffs.values():
+        divisor = gcd(divisor, coeff)
+    if not coeffs:
+        return {}, rhs
+    if coeffs[min(coeffs)] < 0:
+        divisor = -abs(divisor)
+    else:
+        divisor = abs(divisor)
+    return {bit: coeffs[bit] // divisor for bit in sorted(coeffs)}, rhs // divisor
+
+
+def eliminate(row: Row, pivot_row: Row, bit: int) -> Row:
+    """Cancel bit out of row using pivot_row, without leaving the integers"""
+    coeffs, rhs = row
+    pivot_coeffs, pivot_rhs = pivot_row
+    factor, pivot_factor = pivot_coeffs[bit], coeffs[bit]
+
+    combined = {b: c * factor for b, c in coeffs.items()}
+    for b, c in pivot_coeffs.items():
+        value = combined.get(b, 0) - c * pivot_factor
+        if value:
+            combined[b] = value
+        else:
+            combined.pop(b, None)
+
+    return normalize(combined, rhs * factor - pivot_rhs * pivot_factor)
+
+
+def row_reduce(rows: Sequence[Row]) -> List[Row]:
+    """Bring rows into reduced row echelon form, dropping redundant ones"""
+    reduced: List[Tuple[int, Row]] = []
+    for row in rows:
+        for bit, pivot_row in reduced:
+            if bit in row[0]:
+                row = eliminate(row, pivot_row, bit)
+
+        coeffs, rhs = row
+        if not coeffs:
+            if rhs:
+                raise Inconsistent
+            continue
+
+        bit = min(coeffs)
+        reduced = [
+            (other_bit, eliminate(other_row, row, bit) if bit in other_row[0] else other_row)
+            for other_bit, other_row in reduced
+        ]
+        reduced.append((bit, row))
+
+    return [row for _, row in reduced]
+
+
+def bound_row(row: Row) -> Dict[int, int]:
+    """Find the cells of a row which can take only one value
+
+    A cell is fixed if either value would push the row's sum out of reach of
+    its right-hand side, given every other cell's most favourable value.
+
+    >>> bound_row(({0: 1, 1: 1, 2: -1}, 2))
+    {0: 1, 1: 1, 2: 0}
+    >>> bound_row(({0: 1, 1: 1}, 1))
+    {}
+    """
+    coeffs, rhs = row
+    lowest = sum(c for c in coeffs.values() if c < 0)
+    highest = sum(c for c in coeffs.values() if c > 0)
+    if not lowest <= rhs <= highest:
+        raise Inconsistent
+
+    fixed = {}
+    for bit, coeff in coeffs.items():
+        if coeff > 0:
+            if lowest + coeff > rhs:
+                fixed[bit] = 0
+            elif highest - coeff < rhs:
+                fixed[bit] = 1
+        else:
+            if highest + coeff < rhs:
+                fixed[bit] = 0
+            elif lowest - coeff > rhs:
+                fixed[bit] = 1
+    return fixed
+
+
+def substitute(row: Row, known: Dict[int, int]) -> Row:
+    coeffs, rhs = row
+    remaining = {}
+    for bit, coeff in coeffs.items():
+        if bit in known:
+            rhs -= coeff * known[bit]
+        else:
+            remaining[bit] = coeff
+    return remaining, rhs
+
+
+def find_forced(num_cells: int, constraints: Sequence[Constraint]
+                ) -> Optional[Tuple[int, int]]:
+    """Return masks of the cells which must be safe, and which must be mines
+
+    Rows are reduced, then each is bounded by the 0/1 range of its cells. Any
+    cells found fixed are substituted back into the original equations, and
+    the whole repeats until nothing new is learned. Returns None if the
+    constraints contradict one another.
+
+    No constraint here is a subset of another, yet subtracting the middle one
+    from its neighbours settles every cell:
+
+    >>> find_forced(5, [(0b00111, 2), (0b01110, 1), (0b11100, 2)])
+    (10, 21)
+    """
+    rows: List[Row] = [
+        ({bit: 1 for bit in iter_bits(mask)}, mines)
+        for mask, mines in constraints
+    ]
+    known: Dict[int, int] = {}
+
+    try:
+        while True:
+            rows = [row for row in (substitute(row, known) for row in rows) if row[0] or row[1]]
+
+            learned = {}
+            for row in row_reduce(rows) + rows:
+                learned.update(bound_row(row))
+            if not learned:
+                break
+            known.update(learned)
+    except Inconsistent:
+        return None
+
+    safe = mines = 0
+    for bit, value in known.items():
+        if value:
+            mines |= 1 << bit
+        else:
+            safe |= 1 << bit
+    return safe, mines
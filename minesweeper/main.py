@@ -5,6 +5,7 @@ from configargparse import ArgumentParser, FileType
 
 from minesweeper.director.base import get_directors
 from minesweeper import Game
+from minesweeper.game import DIRECTOR_TIME_BUDGET
 
 
 def main(argv=None):
@@ -53,6 +54,13 @@ def main(argv=None):
                         type=int,
                         default=1,
                         help='Number of frames to skip between director steps')
+    parser.add_argument('--director-time-budget',
+                        type=float,
+                        default=DIRECTOR_TIME_BUDGET,
+                        help='Seconds the director may think before acting on the '
+                             'best moves found so far (no limit by default, or if '
+                             '0 or less)',
+                        env_var='MINESWEEPER_DIRECTOR_TIME_BUDGET')
 
     parser.add_argument('-m', '--mode',
                         choices=['winxp', 'win7'],
@@ -87,6 +95,8 @@ def main(argv=None):
 
     game = Game(**kwargs)
     game.director_skip_frames = args.director_skip_frames
+    if args.director_time_budget is not None and args.director_time_budget > 0:
+        game.director_time_budget = args.director_time_budget
 
     if args.scenario and args.state:
         raise RuntimeError("Cannot load both game state (--state) and scenario (-s/--scenario)")
@@ -0,0 +1,275 @@
+"""
+Deductions read from the 5x5 window around a number, by table lookup.
+
+Most forced moves on a real board come from a small set of local patterns
+(1-1, 1-2, 1-2-1 against a wall, and so on). Rather than rediscover them each
+step, each window is encoded as an int key -- the same for all eight rotations
+and reflections of it -- and looked up in a table of the cells it forces.
+
+The table is generated offline by bin/generate-patterns, which plays out
+random boards and solves every window it sees with only the numbers inside it.
+Any such deduction holds regardless of the rest of the board.
+
+Only the numbers of the inner 3x3 are used, as theirs are the only neighbours
+wholly inside the window.
+"""
+import logging
+import os
+import struct
+import zlib
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from minesweeper.probability import solve_system
+
+logger = logging.getLogger(__name__)
+
+
+#: States of a board position, as passed to read_window()
+UNREVEALED = 0
+FLAG = 1
+WALL = 2
+#: Revealed cells are NUMBER0 + their number
+NUMBER0 = 3
+
+#: States of a window position, once read. Anything which can't bear on a
+#: deduction is BLOCKED, so that windows differing only in irrelevant detail
+#: share a key.
+UNKNOWN = 0
+BLOCKED = 1
+#: Numbers of the inner 3x3 are CONSTRAINT0 + the mines they have left to find
+CONSTRAINT0 = 2
+
+RADIUS = 2
+OFFSETS: Tuple[Tuple[int, int], ...] = tuple(
+    (d_x, d_y)
+    for d_y in range(-RADIUS, RADIUS + 1)
+    for d_x in range(-RADIUS, RADIUS + 1)
+)
+INNER = frozenset(i for i, (d_x, d_y) in enumerate(OFFSETS)
+                  if abs(d_x) <= 1 and abs(d_y) <= 1)
+
+#: Bits each position takes in a key: enough for any number inside, and
+#: whether it's unknown outside.
+_WIDTHS = tuple(4 if i in INNER else 1 for i in range(len(OFFSETS)))
+KEY_BYTES = (sum(_WIDTHS) + 7) // 8
+
+#: Window positions neighbouring each position (within the window)
+_NEIGHBORS: Tuple[Tuple[int, ...], ...] = tuple(
+    tuple(j for j, (n_x, n_y) in enumerate(OFFSETS)
+          if j != i and abs(n_x - x) <= 1 and abs(n_y - y) <= 1)
+    for i, (x, y) in enumerate(OFFSETS)
+)
+
+
+def _permutation(transform: Callable[[int, int], Tuple[int, int]]) -> Tuple[int, ...]:
+    return tuple(OFFSETS.index(transform(d_x, d_y)) for d_x, d_y in OFFSETS)
+
+
+#: For each of the eight symmetries of the square, the window position each
+#: transformed position is read from.
+SYMMETRIES: Tuple[Tuple[int, ...], ...] = tuple(map(_permutation, (
+    lambda x, y: (x, y),
+    lambda x, y: (-y, x),
+    lambda x, y: (-x, -y),
+    lambda x, y: (y, -x),
+    lambda x, y: (-x, y),
+    lambda x, y: (x, -y),
+    lambda x, y: (y, x),
+    lambda x, y: (-y, -x),
+)))
+
+
+def cell_state(cell) -> int:
+    """State of a director Cell (or None, if off the board)"""
+    if cell is None:
+        return WALL
+    elif cell.is_unrevealed():
+        return UNREVEALED
+    elif cell.is_flagged():
+        return FLAG
+    else:
+        return NUMBER0 + cell.type
+
+
+def read_window(state_at: Callable[[int, int], int], x: int, y: int) -> List[int]:
+    """Read the window centred on x, y
+
+    state_at(x, y) must return the state of any board position. Only unrevealed
+    cells next to a number of the inner 3x3 are kept UNKNOWN, and those numbers
+    are reduced by the flags around them.
+    """
+    board = [state_at(x + d_x, y + d_y) for d_x, d_y in OFFSETS]
+    numbers = [i for i in INNER if board[i] > NUMBER0]
+
+    states = [BLOCKED] * len(OFFSETS)
+    for i in numbers:
+        for neighbor in _NEIGHBORS[i]:
+            if board[neighbor] == UNREVEALED:
+                states[neighbor] = UNKNOWN
+
+    for i in numbers:
+        neighbors = _NEIGHBORS[i]
+        mines_left = board[i] - NUMBER0 - sum(1 for n in neighbors if board[n] == FLAG)
+        if mines_left < 0:
+            # Misplaced flags: leave the number unsatisfiable, so nothing matches
+            mines_left = len(neighbors) + 1
+        if mines_left or any(states[n] == UNKNOWN for n in neighbors):
+            states[i] = CONSTRAINT0 + mines_left
+
+    return states
+
+
+def encode(states: Sequence[int]) -> int:
+    key = 0
+    for state, width in zip(states, _WIDTHS):
+        key = key << width | state
+    return key
+
+
+def canonicalize(states: Sequence[int]) -> Tuple[int, Tuple[int, ...]]:
+    """Return the smallest key of any symmetry of the window, and that symmetry"""
+    return min(
+        (encode([states[i] for i in permutation]), permutation)
+        for permutation in SYMMETRIES
+    )
+
+
+def solve_window(states: Sequence[int]) -> Optional[Tuple[int, int]]:
+    """Find the positions forced safe, and forced mines, by the inner numbers
+
+    Returns masks over window positions, or None if the numbers contradict.
+    """
+    unknowns = [i for i, state in enumerate(states) if state == UNKNOWN]
+    bits = {position: 1 << bit for bit, position in enumerate(unknowns)}
+
+    constraints = []
+    for i in INNER:
+        if states[i] >= CONSTRAINT0:
+            mask = 0
+            for neighbor in _NEIGHBORS[i]:
+                mask |= bits.get(neighbor, 0)
+            constraints.append((mask, states[i] - CONSTRAINT0))
+
+    if not constraints:
+        return 0, 0
+
+    table = solve_system(len(unknowns), constraints)
+    if not table.counts:
+        return None
+
+    total = sum(table.counts.values())
+    safe = mines = 0
+    for bit, position in enumerate(unknowns):
+        weight = sum(weights[bit] for weights in table.weights.values())
+        if weight == 0:
+            safe |= 1 << position
+        elif weight == total:
+            mines |= 1 << position
+    return safe, mines
+
+
+def windows_touching(cells: Iterable) -> Set:
+    """Numbered director Cells whose windows include any of the passed cells"""
+    found = set()
+    for cell in cells:
+        for d_x, d_y in OFFSETS:
+            neighbor = cell.get_neighbor_at(d_x, d_y)
+            if neighbor is not None and neighbor.is_number():
+                found.add(neighbor)
+    return found
+
+
+class PatternTable(object):
+    """Canonical window keys, mapped to the positions they force"""
+
+    MAGIC = b'MSPT\x02'
+    RECORD = struct.Struct(f'<{KEY_BYTES}sII')
+
+    __slots__ = ('_entries',)
+
+    def __init__(self, entries: Dict[int, Tuple[int, int]] = None):
+        self._entries = dict(entries or {})
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: int):
+        return key in self._entries
+
+    def get(self, key: int) -> Optional[Tuple[int, int]]:
+        """Return the masks forced by a canonical window"""
+        return self._entries.get(key)
+
+    def add(self, key: int, forced: Tuple[int, int]):
+        """Store the masks forced by a canonical window"""
+        self._entries[key] = forced
+
+    def lookup(self, states: Sequence[int]
+               ) -> Optional[Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]]:
+        """Return the offsets forced safe, and forced mines, if the window is known"""
+        key, permutation = canonicalize(states)
+        forced = self.get(key)
+        if forced is None:
+            return None
+
+        safe, mines = forced
+        return (
+            [OFFSETS[permutation[i]] for i in range(len(OFFSETS)) if safe >> i & 1],
+            [OFFSETS[permutation[i]] for i in range(len(OFFSETS)) if mines >> i & 1],
+        )
+
+    def lookup_cell(self, cell) -> Optional[Tuple[list, list]]:
+        """Return the Cells forced safe, and forced mines, around a director Cell"""
+        states = read_window(
+            lambda x, y: cell_state(cell.get_neighbor_at(x - cell.x, y - cell.y)),
+            cell.x, cell.y)
+        found = self.lookup(states)
+        if found is None:
+            return None
+
+        safe, mines = found
+        return (
+            [cell.get_neighbor_at(d_x, d_y) for d_x, d_y in safe],
+            [cell.get_neighbor_at(d_x, d_y) for d_x, d_y in mines],
+        )
+
+    def dumps(self) -> bytes:
+        records = b''.join(
+            self.RECORD.pack(key.to_bytes(KEY_BYTES, 'little'), safe, mines)
+            for key, (safe, mines) in sorted(self._entries.items())
+        )
+        return self.MAGIC + zlib.compress(records, 9)
+
+    @classmethod
+    def loads(cls, data: bytes) -> 'PatternTable':
+        if not data.startswith(cls.MAGIC):
+            raise ValueError('Not a pattern table')
+        records = zlib.decompress(data[len(cls.MAGIC):])
+        return cls({
+            int.from_bytes(key, 'little'): (safe, mines)
+            for key, safe, mines in cls.RECORD.iter_unpack(records)
+        })
+
+    def dump(self, path: str):
+        with open(path, 'wb') as fp:
+            fp.write(self.dumps())
+
+    @classmethod
+    def load(cls, path: str) -> 'PatternTable':
+        with open(path, 'rb') as fp:
+            return cls.loads(fp.read())
+
+
+#: Where the table shipped with the package lives
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), 'data', 'patterns.bin')
+
+
+@lru_cache(maxsize=None)
+def get_pattern_table(path: str = DEFAULT_PATH) -> PatternTable:
+    """Load (once) the table of local patterns; empty if there is none"""
+    try:
+        return PatternTable.load(path)
+    except FileNotFoundError:
+        logger.warning('No pattern table found at %s', path)
+        return PatternTable()
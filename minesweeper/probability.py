@@ -0,0 +1,389 @@
+"""
+Exact mine probabilities, by counting the configurations of each system.
+
+A system is passed in a compact form: its number of cells, and a list of
+constraints, each a (mask, mines) pair stating how many mines lie among the
+cells whose bits are set in mask. Everything here deals only in ints, so the
+results are exact; probabilities are ratios of (potentially huge) counts.
+"""
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+#: A constraint on a system: (mask of cells, number of mines among them)
+Constraint = Tuple[int, int]
+
+
+@lru_cache(maxsize=4096)
+def binomial(n: int, k: int) -> int:
+    """Number of ways to choose k things from n; 0 if impossible
+
+    >>> binomial(5, 2)
+    10
+    >>> binomial(3, 4), binomial(3, -1)
+    (0, 0)
+    """
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    result = 1
+    for i in range(1, k + 1):
+        result = result * (n - k + i) // i
+    return result
+
+
+def convolve(a: Sequence[int], b: Sequence[int]) -> List[int]:
+    """Multiply two polynomials, given as coefficient lists
+
+    >>> convolve([1, 1], [1, 2, 1])
+    [1, 3, 3, 1]
+    """
+    if not a or not b:
+        return []
+    result = [0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        if x:
+            for j, y in enumerate(b):
+                result[i + j] += x * y
+    return result
+
+
+class SystemTable(object):
+    """The valid configurations of one system, tallied by number of mines
+
+    counts[m] is the number of configurations holding m mines, and
+    weights[m][i] how many of those place a mine on cell i.
+    """
+    __slots__ = (
+        'num_cells',
+        'counts',
+        'weights',
+    )
+
+    def __init__(self, num_cells: int, counts: Dict[int, int], weights: Dict[int, List[int]]):
+        self.num_cells = num_cells
+        self.counts = counts
+        self.weights = weights
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(num_cells={self.num_cells}, counts={self.counts!r})'
+
+    def __getstate__(self):
+        return self.num_cells, self.counts, self.weights
+
+    def __setstate__(self, state):
+        self.num_cells, self.counts, self.weights = state
+
+    def polynomial(self) -> List[int]:
+        """counts as a coefficient list, indexed by number of mines"""
+        if not self.counts:
+            return []
+        coefficients = [0] * (max(self.counts) + 1)
+        for mines, count in self.counts.items():
+            coefficients[mines] = count
+        return coefficients
+
+
+def find_cell_classes(num_cells: int, constraints: Sequence[Constraint]
+                      ) -> List[Tuple[List[int], Tuple[int, ...]]]:
+    """Group cells touched by exactly the same constraints
+
+    Cells of a class are interchangeable, so a solver need only decide how many
+    mines each class holds. Returns (cell bits, constraint indices) pairs,
+    ordered so that constraints are closed as early as possible.
+    """
+    members = defaultdict(list)
+    for bit in range(num_cells):
+        key = tuple(i for i, (mask, _) in enumerate(constraints) if mask >> bit & 1)
+        members[key].append(bit)
+
+    # Walk constraints breadth-first over shared cells, so each class's
+    # constraints are near one another in the order classes are visited.
+    rank = {}
+    neighbours = defaultdict(set)
+    for key in members:
+        for i in key:
+            neighbours[i].update(key)
+    for start in range(len(constraints)):
+        if start in rank:
+            continue
+        queue = [start]
+        rank[start] = len(rank)
+        for i in queue:
+            for j in sorted(neighbours[i]):
+                if j not in rank:
+                    rank[j] = len(rank)
+                    queue.append(j)
+
+    return sorted(
+        ((bits, key) for key, bits in members.items()),
+        key=lambda item: (min((rank[i] for i in item[1]), default=-1),
+                          max((rank[i] for i in item[1]), default=-1)),
+    )
+
+
+def solve_system(num_cells: int, constraints: Sequence[Constraint], deadline=None
+                 ) -> SystemTable:
+    """Count every configuration of mines satisfying all constraints
+
+    This backtracks over classes of interchangeable cells, choosing how many
+    mines each holds. Subproblems are memoized on the mines still needed by
+    the constraints left open, which keeps wide frontiers tractable. The
+    search keeps its own stack, so long chains of classes can't overflow
+    Python's.
+
+    If passed, deadline.check() is called before each new subproblem, so a
+    Deadline may abandon the search by raising. To carry on from there later,
+    use a SystemSolver.
+
+    >>> table = solve_system(3, [(0b011, 1), (0b110, 1)])
+    >>> table.counts
+    {1: 1, 2: 1}
+    >>> table.weights[1], table.weights[2]
+    ([0, 1, 0], [1, 0, 1])
+    """
+    return SystemSolver(num_cells, constraints).run(deadline)
+
+
+class SystemSolver(object):
+    """The search of solve_system(), which may be resumed after a deadline
+
+    If run() is abandoned by its deadline, the search is left where it stood:
+    the next run() carries on from there, rather than starting over.
+
+    >>> class Expired:
+    ...     def check(self): raise TimeoutError
+    >>> solver = SystemSolver(3, [(0b011, 1), (0b110, 1)])
+    >>> solver.run(Expired())
+    Traceback (most recent call last):
+      ...
+    TimeoutError
+    >>> solver.run().counts
+    {1: 1, 2: 1}
+    """
+    __slots__ = (
+        'num_cells',
+        'classes',
+        'sizes',
+        'open_before',
+        'closing',
+        'memo',
+        'needs',
+        'stack',
+        'rest',
+        'table',
+    )
+
+    def __init__(self, num_cells: int, constraints: Sequence[Constraint]):
+        self.num_cells = num_cells
+        self.classes = find_cell_classes(num_cells, constraints)
+        self.sizes = [len(bits) for bits, _ in self.classes]
+
+        last_use = {}
+        for position, (_, key) in enumerate(self.classes):
+            for i in key:
+                last_use[i] = position
+
+        # Constraints still open before deciding each class, and those it closes
+        self.open_before = []
+        self.closing = []
+        for position in range(len(self.classes)):
+            self.open_before.append(
+                tuple(sorted(i for i, last in last_use.items() if last >= position)))
+            self.closing.append(
+                tuple(i for i in self.classes[position][1] if last_use[i] == position))
+
+        self.memo = {}
+        self.needs = [mines for _, mines in constraints]
+
+        # Each frame decides how many mines one class holds: [position, memo
+        # key, mines being tried, table of the configurations found so far].
+        # rest is the table of the classes after the top frame's, once known.
+        self.stack = []
+        self.rest = None
+        self.table: Optional[SystemTable] = None
+
+        # Constraints touching no cells at all must already be satisfied
+        if any(mines for i, (_, mines) in enumerate(constraints) if i not in last_use):
+            self.table = SystemTable(num_cells, {}, {})
+        else:
+            self.rest = self._enter(0)
+
+    def _enter(self, position: int) -> Optional[Dict[int, Tuple[int, List[int]]]]:
+        """Return the table of a subproblem, if known; otherwise, begin it"""
+        if position == len(self.classes):
+            return {0: (1, [])}
+
+        key = (position, tuple(self.needs[i] for i in self.open_before[position]))
+        if key in self.memo:
+            return self.memo[key]
+
+        self.stack.append([position, key, -1, {}])
+        return None
+
+    def run(self, deadline=None) -> SystemTable:
+        """Solve the system, or carry on solving it"""
+        if self.table is not None:
+            return self.table
+
+        classes = self.classes
+        sizes = self.sizes
+        closing = self.closing
+        memo = self.memo
+        needs = self.needs
+        stack = self.stack
+        enter = self._enter
+
+        rest = self.rest
+        try:
+            while stack:
+                frame = stack[-1]
+                position, key, mines, table = frame
+                size = sizes[position]
+                touching = classes[position][1]
+
+                if mines < 0 and deadline is not None:
+                    # A new subproblem: nothing is lost by stopping here
+                    deadline.check()
+
+                if rest is not None:
+                    # The rest of the classes are decided, for this many mines in ours
+                    for i in touching:
+                        needs[i] += mines
+
+                    ways = binomial(size, mines)
+                    for rest_mines, (count, weights) in rest.items():
+                        count *= ways
+                        total = mines + rest_mines
+                        if total in table:
+                            prev_count, prev_weights = table[total]
+                            prev_weights[0] += count * mines
+                            for j, weight in enumerate(weights, 1):
+                                prev_weights[j] += weight * ways
+                            table[total] = (prev_count + count, prev_weights)
+                        else:
+                            table[total] = (count, [count * mines] + [weight * ways for weight in weights])
+
+                limit = min([size] + [needs[i] for i in touching])
+                mines += 1
+                while mines <= limit and any(needs[i] != mines for i in closing[position]):
+                    mines += 1
+
+                if mines > limit:
+                    stack.pop()
+                    memo[key] = rest = table
+                    continue
+
+                frame[2] = mines
+                for i in touching:
+                    needs[i] -= mines
+                rest = enter(position + 1)
+        finally:
+            self.rest = rest
+
+        self.table = self._tabulate(rest)
+
+        # Only the table is needed from here on
+        self.memo = {}
+        self.rest = None
+        return self.table
+
+    def _tabulate(self, solved: Dict[int, Tuple[int, List[int]]]) -> SystemTable:
+        counts = {}
+        weights = {}
+        for mines, (count, class_weights) in solved.items():
+            if not count:
+                continue
+            counts[mines] = count
+            cell_weights = [0] * self.num_cells
+            for (bits, _), size, weight in zip(self.classes, self.sizes, class_weights):
+                # Each cell of a class is a mine in an equal share of configurations
+                for bit in bits:
+                    cell_weights[bit] = weight // size
+            weights[mines] = cell_weights
+
+        return SystemTable(self.num_cells, counts, weights)
+
+
+class BoardProbabilities(object):
+    """Exact odds of a mine under every constrained cell, and in the sea
+
+    Each probability is a numerator over the shared total, so certainty can be
+    tested without any floating-point error.
+    """
+    __slots__ = (
+        'total',
+        'cell_weights',
+        'sea_weight',
+        'sea_size',
+    )
+
+    def __init__(self, total: int, cell_weights: List[List[int]], sea_weight: int,
+                 sea_size: int):
+        self.total = total
+        self.cell_weights = cell_weights
+        self.sea_weight = sea_weight
+        self.sea_size = sea_size
+
+    def probability(self, system: int, cell: int) -> float:
+        return self.cell_weights[system][cell] / self.total
+
+    @property
+    def sea_probability(self) -> Optional[float]:
+        if not self.sea_size:
+            return None
+        return self.sea_weight / self.total
+
+    def is_safe(self, system: int, cell: int) -> bool:
+        return self.cell_weights[system][cell] == 0
+
+    def is_mine(self, system: int, cell: int) -> bool:
+        return self.cell_weights[system][cell] == self.total
+
+
+def combine_systems(tables: Sequence[SystemTable], sea_size: int, mines_left: int
+                    ) -> Optional[BoardProbabilities]:
+    """Weigh each system's configurations by the ways the rest of the board fits
+
+    A configuration of one system using m mines is only as likely as the number
+    of ways the other systems and the sea (the unconstrained cells) can hold
+    the remaining mines. Returns None if no configuration of the board fits.
+    """
+    polynomials = [table.polynomial() for table in tables]
+
+    # prefixes[s] convolves systems before s; suffixes[s] those from s onwards
+    prefixes = [[1]]
+    for polynomial in polynomials:
+        prefixes.append(convolve(prefixes[-1], polynomial))
+    suffixes = [[1]]
+    for polynomial in reversed(polynomials):
+        suffixes.append(convolve(suffixes[-1], polynomial))
+    suffixes.reverse()
+
+    def sea_ways(mines: int) -> int:
+        return binomial(sea_size, mines_left - mines)
+
+    everything = prefixes[-1]
+    total = sum(count * sea_ways(mines) for mines, count in enumerate(everything))
+    if not total:
+        return None
+
+    sea_weight = sum(
+        count * binomial(sea_size - 1, mines_left - mines - 1)
+        for mines, count in enumerate(everything)
+    ) if sea_size else 0
+
+    cell_weights = []
+    for s, table in enumerate(tables):
+        others = convolve(prefixes[s], suffixes[s + 1])
+        weights = [0] * table.num_cells
+        for mines, mine_weights in table.weights.items():
+            ways = sum(count * sea_ways(mines + other_mines)
+                       for other_mines, count in enumerate(others))
+            if ways:
+                for cell, weight in enumerate(mine_weights):
+                    weights[cell] += weight * ways
+        cell_weights.append(weights)
+
+    return BoardProbabilities(total, cell_weights, sea_weight, sea_size)
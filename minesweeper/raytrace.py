@@ -19,3 +19,8 @@ def int_trace(x0, y0, x1, y1):
         else:
             y += inc_y
             error += d_x
+
+
+def int_trace_length(x0, y0, x1, y1):
+    """Number of coords int_trace() would yield between two points"""
+    return 1 + abs(x1 - x0) + abs(y1 - y0)
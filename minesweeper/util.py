@@ -30,3 +30,26 @@ def apply_method_filter(iterable, **filters):
         else:
             return True
     return [o for o in iterable if is_valid(o)]
+
+
+def iter_bits(mask):
+    """Yield the positions of all set bits of an int, lowest first
+
+    >>> list(iter_bits(0b10110))
+    [1, 2, 4]
+
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def popcount(mask):
+    """Return the number of set bits of a non-negative int
+
+    >>> popcount(0b10110)
+    3
+
+    """
+    return bin(mask).count('1')
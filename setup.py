@@ -60,6 +60,7 @@ if __name__ == '__main__':
         packages=['minesweeper'],
         package_data={
             'minesweeper': find_files(r'^.+\.(?!py|pyc)[^.]*$',
+                                      from_pkg_root('data'),
                                       from_pkg_root('fonts'),
                                       from_pkg_root('images'))
         },
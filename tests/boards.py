@@ -0,0 +1,140 @@
+"""
+Seeded boards for directors to play in tests, without the game (or pygame)
+"""
+import random
+
+from minesweeper.director.base import BaseControl, Cell, Deadline, Director
+
+
+class Board(object):
+    """A seeded board, which never places a mine under (or beside) the first click"""
+
+    def __init__(self, width, height, num_mines, seed):
+        self.width = width
+        self.height = height
+        self.num_mines = num_mines
+        self.rnd = random.Random(seed)
+
+        self.mines = set()
+        self.revealed = set()
+        self.flagged = set()
+        self.lost = False
+
+    def neighbors(self, x, y):
+        for d_x, d_y in Cell.get_neighbor_deltas():
+            if 0 <= x + d_x < self.width and 0 <= y + d_y < self.height:
+                yield x + d_x, y + d_y
+
+    def number(self, x, y):
+        return sum(1 for coords in self.neighbors(x, y) if coords in self.mines)
+
+    def won(self):
+        return len(self.revealed) + self.num_mines == self.width * self.height
+
+    def reveal(self, x, y, changed: set):
+        if not self.mines:
+            clear = {(x, y), *self.neighbors(x, y)}
+            self.mines = set(self.rnd.sample(sorted(
+                (m_x, m_y)
+                for m_x in range(self.width)
+                for m_y in range(self.height)
+                if (m_x, m_y) not in clear
+            ), self.num_mines))
+
+        if (x, y) in self.mines:
+            self.lost = True
+            return
+
+        queue = [(x, y)]
+        while queue:
+            coords = queue.pop()
+            if coords in self.revealed or coords in self.flagged:
+                continue
+            self.revealed.add(coords)
+            changed.add(coords)
+            if not self.number(*coords):
+                queue.extend(self.neighbors(*coords))
+
+
+class BoardControl(BaseControl):
+    """Play a Board as the game would, sending changes once reset_cache() is called"""
+    __slots__ = ('board', 'cells', 'dirty_cells', 'changed')
+
+    def __init__(self, board: Board):
+        super(BoardControl, self).__init__()
+        self.board = board
+
+        self.cells = {}
+        for y in range(board.height):
+            for x in range(board.width):
+                self.cells[x, y] = Cell(self, x, y, Cell.TYPE_UNREVEALED)
+
+        self.dirty_cells = list(self.cells.values())
+        self.changed = set()
+
+    def click(self, x, y):
+        super(BoardControl, self).click(x, y)
+        if (x, y) not in self.board.flagged:
+            self.board.reveal(x, y, self.changed)
+
+    def right_click(self, x, y):
+        super(BoardControl, self).right_click(x, y)
+        if (x, y) not in self.board.revealed:
+            self.board.flagged ^= {(x, y)}
+            self.changed.add((x, y))
+
+    def middle_click(self, x, y):
+        super(BoardControl, self).middle_click(x, y)
+        if (x, y) not in self.board.revealed:
+            return
+
+        neighbors = list(self.board.neighbors(x, y))
+        if sum(1 for coords in neighbors if coords in self.board.flagged) == self.board.number(x, y):
+            for coords in neighbors:
+                if coords not in self.board.flagged:
+                    self.board.reveal(*coords, self.changed)
+
+    def get_cell(self, x, y):
+        return self.cells.get((x, y))
+
+    def get_cells(self):
+        return list(self.cells.values())
+
+    def get_dirty_cells(self):
+        return self.dirty_cells
+
+    def get_board_size(self):
+        return self.board.width, self.board.height
+
+    def get_mines_left(self):
+        return self.board.num_mines - len(self.board.flagged)
+
+    def reset_cache(self):
+        self.dirty_cells = []
+        for coords in self.changed:
+            cell = self.cells[coords]
+            if coords in self.board.flagged:
+                cell.type = Cell.TYPE_FLAG
+            elif coords in self.board.revealed:
+                cell.type = self.board.number(*coords)
+            else:
+                cell.type = Cell.TYPE_UNREVEALED
+            self.dirty_cells.append(cell)
+        self.invalidate_neighbor_stats(self.dirty_cells)
+        self.changed.clear()
+
+
+def start(director: Director, board: Board) -> BoardControl:
+    control = BoardControl(board)
+    director.set_control(control)
+    director.reset()
+    return control
+
+
+def play(director: Director, control: BoardControl, max_steps=2000, time_budget=None):
+    board = control.board
+    for _ in range(max_steps):
+        if board.lost or board.won():
+            break
+        director.act(Deadline.after(time_budget))
+        control.reset_cache()
@@ -0,0 +1,60 @@
+import pytest
+
+from minesweeper.director.attempt1 import AttemptUnoDirector
+from minesweeper.patterns import get_pattern_table
+
+from boards import Board, play, start
+
+#: Planners which guess, rather than deduce
+GUESSES = {'expand_cardinally', 'expand_randomly', 'choose_randomly'}
+
+
+class CheckedAttemptUnoDirector(AttemptUnoDirector):
+    """Fail the test upon any deduction the board proves wrong, or any drift
+    of the state refreshed each step from that built afresh
+    """
+
+    def iter_plans(self, planners, deadline=None, unbounded=()):
+        board = self.control.board
+        for planner, plan in super(CheckedAttemptUnoDirector, self).iter_plans(
+                planners, deadline, unbounded):
+            if planner.__name__ not in GUESSES:
+                for action, cell in plan:
+                    if action == 'middle_click':
+                        assert not any(coords in board.mines
+                                       for coords in board.neighbors(cell.x, cell.y)
+                                       if coords not in board.flagged), (planner, action, cell)
+                    else:
+                        is_mine = (cell.x, cell.y) in board.mines
+                        assert is_mine == (action == 'right_click'), (planner, action, cell)
+            yield planner, plan
+
+    def refresh_state(self):
+        super(CheckedAttemptUnoDirector, self).refresh_state()
+
+        rebuilt = AttemptUnoDirector(self.control)
+        rebuilt.refresh_state()
+
+        assert {cell.idx for cell in self._numbered} == {cell.idx for cell in rebuilt._numbered}
+        assert {cell.idx for cell in self._unrevealed} == {cell.idx for cell in rebuilt._unrevealed}
+        assert self._revealed == rebuilt._revealed
+        assert ({cell.idx: self._graph.props_of(cell) for cell in self._graph} ==
+                {cell.idx: rebuilt._graph.props_of(cell) for cell in rebuilt._graph})
+
+        # Windows are only looked up again once they change, so any which
+        # matches a pattern must still be a candidate
+        table = get_pattern_table()
+        for cell in self._numbered:
+            if table.lookup_cell(cell):
+                assert cell in self._pattern_candidates
+
+
+@pytest.mark.parametrize('time_budget', [None, 0.001])
+@pytest.mark.parametrize('seed', range(8))
+def test_plays_soundly(seed, time_budget):
+    board = Board(16, 16, 40, seed)
+    director = CheckedAttemptUnoDirector()
+    play(director, start(director, board), time_budget=time_budget)
+
+    assert board.lost or board.won()
+    assert board.flagged <= board.mines
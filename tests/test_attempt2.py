@@ -0,0 +1,85 @@
+import pytest
+
+from minesweeper.director import attempt2
+from minesweeper.director.attempt2 import AttemptDosDirector
+
+from boards import Board, play, start
+
+#: Messages of the moves attempt2 makes only when it's certain of them
+CERTAIN = {'FLAG', 'REVEAL', 'PATTERN', 'REDUCED', 'SAFE', 'MINE'}
+
+
+@pytest.fixture
+def checked_moves(monkeypatch):
+    """Fail the test upon any certain move the board proves wrong"""
+    exec_moves = attempt2.exec_moves
+    checked = []
+
+    def exec_checked_moves(moves, extra_message=''):
+        moves = list(moves)
+        for method_name, cell, *message in moves:
+            if message and message[0] in CERTAIN:
+                is_mine = (cell.x, cell.y) in cell._control.board.mines
+                assert is_mine == (method_name == 'right_click'), (method_name, cell, message)
+                checked.append(cell)
+        exec_moves(moves, extra_message)
+
+    monkeypatch.setattr(attempt2, 'exec_moves', exec_checked_moves)
+    return checked
+
+
+@pytest.mark.parametrize('time_budget', [None, 0.001])
+@pytest.mark.parametrize('seed', range(8))
+def test_plays_soundly(checked_moves, seed, time_budget):
+    board = Board(30, 16, 99, seed)
+    director = AttemptDosDirector()
+    play(director, start(director, board), time_budget=time_budget)
+    director.close()
+
+    assert board.lost or board.won()
+    assert board.flagged <= board.mines
+
+
+@pytest.mark.parametrize('time_budget', [None, 0.001])
+def test_plays_soundly_with_solver_processes(checked_moves, time_budget):
+    # However small, systems are sent to the pool whenever there are several
+    director = AttemptDosDirector(solver_processes=2, parallel_threshold=1)
+    for seed in range(4):
+        board = Board(30, 16, 99, seed)
+        play(director, start(director, board), time_budget=time_budget)
+
+        assert board.lost or board.won()
+        assert board.flagged <= board.mines
+
+    if time_budget is None:
+        # Given so little time, a step is usually up before there's any solving
+        assert director._pool is not None
+    director.close()
+
+
+def test_forgets_solutions_once_their_cells_change(checked_moves):
+    board = Board(30, 16, 99, 0)
+    director = AttemptDosDirector()
+    control = start(director, board)
+
+    for _ in range(2000):
+        if board.lost or board.won():
+            break
+        director.act()
+        control.reset_cache()
+
+        # As the next step would, before looking any up: what's left cached
+        # must describe the board as it stands
+        director.forget_dirty_solutions()
+        edges = {
+            (cell.idx,
+             cell.num_flags_left,
+             tuple(sorted(neighbor.idx for neighbor in cell.get_unrevealed_neighbors())))
+            for cell in control.get_cells()
+            if cell.is_number()
+        }
+        for signature in director._solutions:
+            assert set(signature) <= edges
+
+    assert checked_moves
+    director.close()
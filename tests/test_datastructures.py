@@ -0,0 +1,163 @@
+import random
+
+import pytest
+
+from minesweeper.datastructures import (
+    BitsetPropertyGraph,
+    CellGraph,
+    DisjointSet,
+    PropertyGraph,
+    with_bitsets,
+)
+
+
+def random_objects(rnd: random.Random, num_objects=24, num_props=16, max_props=5):
+    return [
+        (i, frozenset(rnd.sample(range(num_props), rnd.randint(1, max_props))))
+        for i in range(num_objects)
+    ]
+
+
+def get_props(o):
+    return o[1]
+
+
+def assert_graphs_agree(expected: PropertyGraph, actual: PropertyGraph, props):
+    assert set(actual) == set(expected)
+    assert actual.all_props() == expected.all_props()
+
+    for o in expected:
+        assert actual.props_of(o) == expected.props_of(o)
+        assert actual.relatives_of(o) == expected.relatives_of(o)
+        assert actual.relatives_equal_to(o) == expected.relatives_equal_to(o)
+        for strict in (False, True):
+            assert (actual.relatives_contained_by(o, strict=strict) ==
+                    expected.relatives_contained_by(o, strict=strict))
+            assert (actual.relatives_containing(o, strict=strict) ==
+                    expected.relatives_containing(o, strict=strict))
+
+    for prop in props:
+        assert actual.objects_containing(prop) == expected.objects_containing(prop)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_bitset_graph_agrees_with_set_graph(seed):
+    rnd = random.Random(seed)
+    objects = random_objects(rnd)
+    props = range(20)
+
+    expected = PropertyGraph(objects, get_props)
+    actual = BitsetPropertyGraph(objects, get_props)
+    assert_graphs_agree(expected, actual, props)
+
+    for _ in range(30):
+        action = rnd.randrange(4)
+        if action == 0 and list(expected):
+            o = rnd.choice(sorted(expected))
+            expected.remove(o)
+            actual.remove(o)
+        elif action == 1:
+            prop = rnd.choice(props)
+            expected.remove_prop(prop)
+            actual.remove_prop(prop)
+        elif action == 2:
+            o = rnd.choice(objects)
+            prop = rnd.choice(props)
+            expected.add_prop(o, prop)
+            actual.add_prop(o, prop)
+        else:
+            o = rnd.choice(objects)
+            expected.add(o)
+            actual.add(o)
+
+        assert_graphs_agree(expected, actual, props)
+
+        query = rnd.sample(props, 6)
+        ignore = rnd.sample(props, 2)
+        assert (actual.objects_contained_by(query, ignore) ==
+                expected.objects_contained_by(query, ignore))
+
+
+def test_with_bitsets():
+    bitset_cls = with_bitsets(CellGraph)
+    assert issubclass(bitset_cls, CellGraph)
+    assert issubclass(bitset_cls, BitsetPropertyGraph)
+    assert with_bitsets(CellGraph) is bitset_cls
+    assert with_bitsets(bitset_cls) is bitset_cls
+    assert with_bitsets(PropertyGraph) is BitsetPropertyGraph
+
+
+def test_bitset_graph_recycles_bits_of_removed_props():
+    graph = BitsetPropertyGraph([('a', 'xy'), ('b', 'yz')], lambda o: o[1])
+    graph.remove_prop('x')
+    graph.add(('c', 'w'))
+
+    assert graph.all_props() == {'w', 'y', 'z'}
+    assert graph.objects_containing('w') == {('c', 'w')}
+    assert graph.objects_containing('x') == set()
+    assert graph.props_of(('a', 'xy')) == {'y'}
+
+
+def brute_force_components(graph: PropertyGraph):
+    """Connected components, by searching from each object over shared props"""
+    components = set()
+    seen = set()
+    for start in graph:
+        if start in seen:
+            continue
+        component = {start}
+        queue = [start]
+        for o in queue:
+            for other in graph:
+                if other not in component and graph.props_of(o) & graph.props_of(other):
+                    component.add(other)
+                    queue.append(other)
+        seen |= component
+        components.add(frozenset(component))
+    return components
+
+
+def test_disjoint_set():
+    components = DisjointSet(range(6))
+    components.union(0, 1)
+    components.union(2, 3)
+    components.union(1, 3)
+
+    assert components.find(0) == components.find(3)
+    assert components.members(2) == {0, 1, 2, 3}
+    assert sorted(map(sorted, components.groups())) == [[0, 1, 2, 3], [4], [5]]
+
+    assert components.remove_set(1) == {0, 1, 2, 3}
+    assert 0 not in components
+    assert sorted(map(sorted, components.groups())) == [[4], [5]]
+
+
+@pytest.mark.parametrize('graph_cls', [PropertyGraph, BitsetPropertyGraph])
+@pytest.mark.parametrize('seed', range(20))
+def test_components_are_maintained(graph_cls, seed):
+    rnd = random.Random(seed)
+    objects = random_objects(rnd, num_objects=16, num_props=24, max_props=3)
+    props = range(24)
+
+    graph = graph_cls(objects, get_props)
+    assert set(graph.components()) == brute_force_components(graph)
+
+    for _ in range(30):
+        action = rnd.randrange(4)
+        if action == 0 and list(graph):
+            graph.remove(rnd.choice(sorted(graph)))
+        elif action == 1:
+            graph.remove_prop(rnd.choice(props))
+        elif action == 2:
+            graph.add_prop(rnd.choice(objects), rnd.choice(props))
+        else:
+            graph.add(rnd.choice(objects))
+
+        expected = brute_force_components(graph)
+        assert set(graph.components()) == expected
+        for o in graph:
+            assert o in graph.component_of(o)
+            assert graph.component_of(o) in expected
+        assert graph.get_independent_objects() == {
+            o for component in expected if len(component) == 1 for o in component
+        }
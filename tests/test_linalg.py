@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from minesweeper.linalg import find_forced
+
+
+def random_constraints(rnd: random.Random, num_cells: int, mines: int, max_constraints=6):
+    """Random constraints which the passed mask of mines satisfies"""
+    constraints = []
+    for _ in range(rnd.randint(1, max_constraints)):
+        mask = rnd.getrandbits(num_cells) or 1
+        constraints.append((mask, bin(mask & mines).count('1')))
+    return constraints
+
+
+def configurations(num_cells, constraints):
+    return [
+        mines
+        for mines in range(1 << num_cells)
+        if all(bin(mines & mask).count('1') == count for mask, count in constraints)
+    ]
+
+
+@pytest.mark.parametrize('seed', range(300))
+def test_find_forced_is_sound(seed):
+    rnd = random.Random(seed)
+    num_cells = rnd.randint(1, 10)
+    constraints = random_constraints(rnd, num_cells, rnd.getrandbits(num_cells))
+    solutions = configurations(num_cells, constraints)
+
+    forced = find_forced(num_cells, constraints)
+    assert forced is not None
+    safe, mines = forced
+    assert not safe & mines
+    for solution in solutions:
+        assert not solution & safe
+        assert solution & mines == mines
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_find_forced_detects_contradictions(seed):
+    rnd = random.Random(seed)
+    num_cells = rnd.randint(1, 8)
+    constraints = random_constraints(rnd, num_cells, rnd.getrandbits(num_cells))
+
+    # Claim one more mine than fits among some constraint's cells
+    mask, _ = rnd.choice(constraints)
+    constraints.append((mask, bin(mask).count('1') + 1))
+
+    assert configurations(num_cells, constraints) == []
+    assert find_forced(num_cells, constraints) is None
+
+
+def test_find_forced_without_subsets():
+    # A 1-2-1 over five unrevealed cells: mines lie under the 1s
+    constraints = [(0b00111, 1), (0b01110, 2), (0b11100, 1)]
+    assert configurations(5, constraints) == [0b01010]
+    assert find_forced(5, constraints) == (0b10101, 0b01010)
@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from minesweeper.patterns import (
+    FLAG,
+    NUMBER0,
+    OFFSETS,
+    SYMMETRIES,
+    UNREVEALED,
+    WALL,
+    PatternTable,
+    canonicalize,
+    encode,
+    get_pattern_table,
+    read_window,
+    solve_window,
+)
+
+
+def random_window(rnd: random.Random):
+    """Read the window of a random, partly revealed board around (0, 0)"""
+    # A wall may cut off some side of the window
+    lo_x, lo_y = rnd.choice([-2, -1, -3]), rnd.choice([-2, -1, -3])
+    hi_x, hi_y = rnd.choice([2, 1, 3]), rnd.choice([2, 1, 3])
+    coords = [(x, y) for x in range(lo_x, hi_x + 1) for y in range(lo_y, hi_y + 1)]
+
+    mines = {coord for coord in coords if rnd.random() < 0.2}
+    revealed = {coord for coord in coords if coord not in mines and rnd.random() < 0.5}
+    flagged = {coord for coord in mines if rnd.random() < 0.3}
+
+    def state_at(x, y):
+        if not (lo_x <= x <= hi_x and lo_y <= y <= hi_y):
+            return WALL
+        elif (x, y) in flagged:
+            return FLAG
+        elif (x, y) in revealed:
+            return NUMBER0 + sum(1 for d_x in (-1, 0, 1) for d_y in (-1, 0, 1)
+                                 if (x + d_x, y + d_y) in mines)
+        else:
+            return UNREVEALED
+
+    return read_window(state_at, 0, 0)
+
+
+def forced_offsets(states):
+    safe, mines = solve_window(states)
+    return (
+        sorted(OFFSETS[i] for i in range(len(OFFSETS)) if safe >> i & 1),
+        sorted(OFFSETS[i] for i in range(len(OFFSETS)) if mines >> i & 1),
+    )
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_canonical_key_is_shared_by_symmetries(seed):
+    states = random_window(random.Random(seed))
+    key, permutation = canonicalize(states)
+    assert encode([states[i] for i in permutation]) == key
+
+    for symmetry in SYMMETRIES:
+        transformed = [states[i] for i in symmetry]
+        assert canonicalize(transformed)[0] == key
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_lookup_maps_forced_cells_back_through_symmetries(seed):
+    states = random_window(random.Random(seed))
+    key, permutation = canonicalize(states)
+
+    table = PatternTable()
+    table.add(key, solve_window([states[i] for i in permutation]))
+
+    for symmetry in SYMMETRIES:
+        transformed = [states[i] for i in symmetry]
+        safe, mines = table.lookup(transformed)
+        assert (sorted(safe), sorted(mines)) == forced_offsets(transformed)
+
+
+def test_table_round_trips():
+    rnd = random.Random(0)
+    table = PatternTable()
+    keys = set()
+    for _ in range(200):
+        states = random_window(rnd)
+        key, permutation = canonicalize(states)
+        table.add(key, solve_window([states[i] for i in permutation]) or (0, 0))
+        keys.add(key)
+
+    loaded = PatternTable.loads(table.dumps())
+    assert len(loaded) == len(table) == len(keys)
+    assert all(loaded.get(key) == table.get(key) for key in keys)
+    assert loaded.dumps() == table.dumps()
+
+    with pytest.raises(ValueError):
+        PatternTable.loads(b'nope' + table.dumps())
+
+
+def test_shipped_table_is_sound():
+    table = get_pattern_table()
+    rnd = random.Random(0)
+    for _ in range(2000):
+        states = random_window(rnd)
+        found = table.lookup(states)
+        if found is not None and solve_window(states) is not None:
+            safe, mines = found
+            assert (sorted(safe), sorted(mines)) == forced_offsets(states)
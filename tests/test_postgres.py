@@ -0,0 +1,94 @@
+import os
+
+import pytest
+
+from minesweeper.director.base import Deadline
+from minesweeper.director.postgres import PostgresDirector
+
+from boards import Board, play, start
+
+pytestmark = pytest.mark.skipif(not os.getenv('DATABASE_URL'), reason='DATABASE_URL is not set')
+
+
+def get_deductions(director: PostgresDirector):
+    """The cells each observation makes certain, as (x, y, is_mine)"""
+    with director.engine.begin() as connection:
+        return set(map(tuple, connection.execute(f'''
+            SELECT DISTINCT cell.x, cell.y, observation.num_mines_remaining > 0
+            FROM {director.schema}.observation, unnest(observation.cells) AS certain (idx)
+            JOIN {director.schema}.cell ON cell.idx = certain.idx
+            WHERE observation.num_mines_remaining IN (0, cardinality(observation.cells))
+        ''')))
+
+
+class CheckedPostgresDirector(PostgresDirector):
+    """Fail the test upon any certain deduction the board proves wrong
+
+    If passed a director to rebuild with, each step's deductions are checked
+    against those it makes loading the whole board from scratch, too.
+    """
+
+    def __init__(self, *args, rebuilt: PostgresDirector = None, **kwargs):
+        super(CheckedPostgresDirector, self).__init__(*args, debug=False, **kwargs)
+        self.rebuilt = rebuilt
+
+    def step(self, mappings, deadline: Deadline):
+        moves = super(CheckedPostgresDirector, self).step(mappings, deadline)
+
+        deductions = get_deductions(self)
+        for x, y, is_mine in deductions:
+            assert ((x, y) in self.control.board.mines) == is_mine, (x, y, is_mine)
+
+        if self.rebuilt is not None:
+            self.rebuilt.set_control(self.control)
+            self.rebuilt.reset()
+            self.rebuilt.step(self.rebuilt._get_cell_updates(), Deadline())
+            assert get_deductions(self.rebuilt) == deductions
+
+        return moves
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_plays_soundly(seed):
+    board = Board(16, 16, 40, seed)
+    director = CheckedPostgresDirector()
+    play(director, start(director, board))
+    director.close()
+
+    assert board.lost or board.won()
+    assert board.flagged <= board.mines
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_maintains_observations_as_if_rebuilt(seed):
+    rebuilt = PostgresDirector(debug=False)
+    board = Board(16, 16, 40, seed)
+    director = CheckedPostgresDirector(rebuilt=rebuilt)
+    play(director, start(director, board))
+    director.close()
+    rebuilt.close()
+
+    assert board.lost or board.won()
+
+
+def test_games_keep_to_their_own_schemas():
+    # Sharing a single connection, each game must still find its own tables
+    games = []
+    for seed, size in enumerate((9, 16)):
+        board = Board(size, size, size * size // 6, seed)
+        director = CheckedPostgresDirector(pool_size=1)
+        games.append((director, start(director, board)))
+    assert games[0][0].schema != games[1][0].schema
+
+    while any(not (control.board.lost or control.board.won()) for _, control in games):
+        for director, control in games:
+            if not (control.board.lost or control.board.won()):
+                director.act()
+                control.reset_cache()
+
+    for director, control in games:
+        with director.engine.begin() as connection:
+            num_cells = connection.execute(f'SELECT count(*) FROM {director.schema}.cell').scalar()
+        assert num_cells == control.board.width * control.board.height
+        assert control.board.flagged <= control.board.mines
+        director.close()
@@ -0,0 +1,95 @@
+import random
+from itertools import product
+from typing import List, Sequence
+
+import pytest
+
+from minesweeper.probability import (
+    Constraint,
+    binomial,
+    combine_systems,
+    solve_system,
+)
+
+
+def random_system(rnd: random.Random, max_cells=10, max_constraints=6):
+    """A system of random constraints, mine counts not necessarily satisfiable"""
+    num_cells = rnd.randint(1, max_cells)
+    constraints = []
+    for _ in range(rnd.randint(0, max_constraints)):
+        mask = rnd.getrandbits(num_cells) or 1
+        constraints.append((mask, rnd.randint(0, bin(mask).count('1'))))
+    return num_cells, constraints
+
+
+def configurations(num_cells: int, constraints: Sequence[Constraint]) -> List[int]:
+    """Every mask of mines satisfying all constraints, by trying them all"""
+    return [
+        mines
+        for mines in range(1 << num_cells)
+        if all(bin(mines & mask).count('1') == count for mask, count in constraints)
+    ]
+
+
+def brute_force_table(num_cells: int, constraints: Sequence[Constraint]):
+    counts = {}
+    weights = {}
+    for mines in configurations(num_cells, constraints):
+        num_mines = bin(mines).count('1')
+        counts[num_mines] = counts.get(num_mines, 0) + 1
+        cell_weights = weights.setdefault(num_mines, [0] * num_cells)
+        for bit in range(num_cells):
+            cell_weights[bit] += mines >> bit & 1
+    return counts, weights
+
+
+@pytest.mark.parametrize('seed', range(200))
+def test_solve_system_matches_brute_force(seed):
+    num_cells, constraints = random_system(random.Random(seed))
+    table = solve_system(num_cells, constraints)
+    assert (table.counts, table.weights) == brute_force_table(num_cells, constraints)
+
+
+def test_solve_system_long_chain():
+    # Each pair of neighbouring cells holds one mine: far more classes than
+    # the recursion limit, with only two ways to place the mines.
+    num_cells = 1200
+    constraints = [(0b11 << i, 1) for i in range(num_cells - 1)]
+
+    table = solve_system(num_cells, constraints)
+    assert table.counts == {600: 2}
+    assert table.weights[600] == [1] * num_cells
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_combine_systems_matches_brute_force(seed):
+    rnd = random.Random(seed)
+    systems = [random_system(rnd, max_cells=5, max_constraints=3)
+               for _ in range(rnd.randint(1, 3))]
+    sea_size = rnd.randint(0, 5)
+    mines_left = rnd.randint(0, sum(num_cells for num_cells, _ in systems) + sea_size)
+
+    tables = [solve_system(num_cells, constraints) for num_cells, constraints in systems]
+    board = combine_systems(tables, sea_size, mines_left)
+
+    # Weigh each arrangement of every system by the ways the sea holds the rest
+    total = 0
+    sea_weight = 0
+    cell_weights = [[0] * num_cells for num_cells, _ in systems]
+    for arrangement in product(*(configurations(*system) for system in systems)):
+        num_mines = sum(bin(mines).count('1') for mines in arrangement)
+        ways = binomial(sea_size, mines_left - num_mines)
+        total += ways
+        if sea_size:
+            sea_weight += binomial(sea_size - 1, mines_left - num_mines - 1)
+        for weights, mines in zip(cell_weights, arrangement):
+            for bit in range(len(weights)):
+                weights[bit] += ways * (mines >> bit & 1)
+
+    if not total:
+        assert board is None
+        return
+
+    assert board.total == total
+    assert board.sea_weight == sea_weight
+    assert board.cell_weights == cell_weights
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+from minesweeper.director.sqlite import SqliteDirector
+
+from boards import Board, play, start
+
+
+class CheckedSqliteDirector(SqliteDirector):
+    """Fail the test upon any certain move the board proves wrong"""
+
+    def choose_eager_moves(self):
+        moves = super(CheckedSqliteDirector, self).choose_eager_moves()
+        for action, cell in moves:
+            is_mine = (cell.x, cell.y) in self.control.board.mines
+            assert is_mine == (action == 'right_click'), f'{action} on {cell}'
+        return moves
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_plays_soundly(seed):
+    board = Board(16, 16, 40, seed)
+    director = CheckedSqliteDirector()
+    play(director, start(director, board))
+    director.close()
+
+    assert board.lost or board.won()
+    assert board.flagged <= board.mines
+
+
+def test_acts_on_another_thread():
+    director = SqliteDirector()
+    errors = []
+
+    def play_on_thread(control):
+        try:
+            play(director, control)
+        except Exception as e:
+            errors.append(e)
+
+    # The game constructs and resets its director on one thread, and has it
+    # act on another
+    for seed in range(3):
+        board = Board(9, 9, 10, seed)
+        thread = threading.Thread(target=play_on_thread, args=(start(director, board),))
+        thread.start()
+        thread.join()
+
+        assert errors == []
+        assert board.lost or board.won()
+
+    director.close()
+
+
+def test_makes_no_moves_without_unrevealed_cells():
+    board = Board(4, 4, 1, 0)
+    director = SqliteDirector()
+    control = start(director, board)
+
+    # Reveal and flag everything, without the director noticing it's over
+    control.click(0, 0)
+    mine, = board.mines
+    control.right_click(*mine)
+    for x, y in control.cells:
+        control.click(x, y)
+    control.reset_cache()
+    assert board.won() and not board.lost
+
+    num_actions = len(control.get_history())
+    director.act()
+    assert len(control.get_history()) == num_actions
+    director.close()
+
+
+def test_discards_contradicting_duplicates():
+    director = SqliteDirector()
+    observations = [
+        # Same cells, same mines: only the first is kept
+        (1, 2, [10, 11, 12]),
+        (2, 2, [10, 11, 12]),
+        # Same cells, different mines: none can be trusted
+        (3, 1, [20, 21]),
+        (4, 1, [20, 21]),
+        (5, 2, [20, 21]),
+        # Overlapping isn't duplicating
+        (6, 1, [10, 11]),
+    ]
+    director.db.executemany('INSERT INTO observation VALUES (?, 0, ?, ?)',
+                            ((id_, num_mines, len(cells)) for id_, num_mines, cells in observations))
+    director.db.executemany('INSERT INTO observation_cell VALUES (?, ?)',
+                            ((id_, idx) for id_, _, cells in observations for idx in cells))
+
+    director.delete_duplicate_observations()
+
+    ids = [id_ for id_, in director.db.execute('SELECT id FROM observation ORDER BY id')]
+    assert ids == [1, 6]
+    cell_ids = {id_ for id_, in director.db.execute('SELECT observation_id FROM observation_cell')}
+    assert cell_ids == {1, 6}
+    director.close()